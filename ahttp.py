@@ -0,0 +1,176 @@
+# ahttp.py
+# Minimal async HTTP/1.1 client for OTA: one keep-alive connection, chunked bodies
+#
+# Needs MicroPython 1.22 or later: HTTPS goes through ssl.SSLContext and
+# asyncio.open_connection(ssl=...), which older firmware doesn't have.
+# Every read is bounded by the client's timeout, so a stalled server fails
+# the update instead of hanging it.
+
+import uasyncio as asyncio
+import ssl
+
+class Response:
+    def __init__(self, client, status, headers):
+        self.client = client
+        self.status = status
+        self.headers = headers
+        self.chunked = "chunked" in headers.get("transfer-encoding", "")
+        length = headers.get("content-length")
+        # None = read until the server closes
+        self._left = int(length) if length is not None else None
+        self._chunk_left = 0
+        self._eof = self._left == 0 or status in (204, 304)
+        if self._left is None and not self.chunked and not self._eof:
+            client.keep_alive = False
+
+    async def readinto(self, mv):
+        """Reads up to len(mv) body bytes. Returns 0 at the end of the body."""
+        if self._eof:
+            return 0
+        reader = self.client.reader
+        timeout = self.client.timeout
+
+        if self.chunked:
+            if self._chunk_left == 0:
+                line = await asyncio.wait_for(reader.readline(), timeout)
+                size = int(line.split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    # Skip optional trailers up to the blank line
+                    while True:
+                        line = await asyncio.wait_for(reader.readline(), timeout)
+                        if not line or line == b"\r\n":
+                            break
+                    self._eof = True
+                    return 0
+                self._chunk_left = size
+            want = min(len(mv), self._chunk_left)
+        elif self._left is not None:
+            want = min(len(mv), self._left)
+        else:
+            want = len(mv)
+
+        n = await asyncio.wait_for(reader.readinto(mv[:want]), timeout)
+        if not n:
+            self._eof = True
+            if self._left or self._chunk_left:
+                raise OSError("Connection closed mid-body")
+            self.client.keep_alive = False
+            return 0
+
+        if self.chunked:
+            self._chunk_left -= n
+            if self._chunk_left == 0:
+                await asyncio.wait_for(reader.readexactly(2), timeout)
+        elif self._left is not None:
+            self._left -= n
+            if self._left == 0:
+                self._eof = True
+        return n
+
+    async def read(self):
+        """Reads the whole body. Only for small bodies such as the manifest."""
+        parts = []
+        buf = bytearray(256)
+        mv = memoryview(buf)
+        while True:
+            n = await self.readinto(mv)
+            if not n:
+                break
+            parts.append(bytes(mv[:n]))
+        return b"".join(parts)
+
+    async def drain(self):
+        """Discards the rest of the body so the connection can be reused."""
+        buf = bytearray(128)
+        mv = memoryview(buf)
+        while await self.readinto(mv):
+            pass
+
+
+class HTTPClient:
+    def __init__(self, base_url, timeout=10):
+        proto, rest = base_url.split("://", 1)
+        host, _, path = rest.partition("/")
+        self.secure = proto == "https"
+        if ":" in host:
+            host, port = host.split(":")
+            self.port = int(port)
+        else:
+            self.port = 443 if self.secure else 80
+        self.host = host
+        self.base_path = "/" + path.rstrip("/") if path else ""
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.keep_alive = False
+        self._pending = None
+
+    async def _connect(self):
+        await self.close()
+        ctx = None
+        if self.secure:
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            ctx.verify_mode = ssl.CERT_NONE
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=ctx), self.timeout)
+        self.keep_alive = True
+
+    async def get(self, path, headers=None):
+        """Sends a GET for base_url/path and returns a Response once the headers are in."""
+        if self._pending:
+            try:
+                await self._pending.drain()
+            except:
+                self.keep_alive = False
+            self._pending = None
+
+        for attempt in range(2):
+            if not self.writer or not self.keep_alive:
+                await self._connect()
+            try:
+                return await asyncio.wait_for(self._request(path, headers), self.timeout)
+            except Exception as e:
+                # A reused connection may have been closed by the server; retry once fresh
+                self.keep_alive = False
+                if attempt:
+                    raise e
+
+    async def _request(self, path, headers):
+        req = "GET {}/{} HTTP/1.1\r\nHost: {}\r\nConnection: keep-alive\r\n".format(
+            self.base_path, path, self.host)
+        if headers:
+            for k, v in headers.items():
+                req += "{}: {}\r\n".format(k, v)
+        self.writer.write(req.encode() + b"\r\n")
+        await self.writer.drain()
+
+        line = await self.reader.readline()
+        if not line:
+            raise OSError("Connection closed")
+        status = int(line.split(b" ", 2)[1])
+
+        hdrs = {}
+        while True:
+            line = await self.reader.readline()
+            if not line or line == b"\r\n":
+                break
+            k, _, v = line.decode().partition(":")
+            hdrs[k.strip().lower()] = v.strip()
+
+        if hdrs.get("connection", "").lower() == "close":
+            self.keep_alive = False
+
+        res = Response(self, status, hdrs)
+        self._pending = res
+        return res
+
+    async def close(self):
+        if self.writer:
+            try:
+                self.writer.close()
+                await self.writer.wait_closed()
+            except:
+                pass
+        self.reader = None
+        self.writer = None
+        self._pending = None
@@ -1,13 +1,16 @@
 import machine
 import os
 import time
+import state
+import bootprof
+bootprof.mark("boot")
+import reset_detect
 
-FLAG_FILE = ".reset_flag"
 WIFI_FILE = "wifi.dat"
 led = machine.Pin(33, machine.Pin.OUT)
 
 # 1. Check if the "Double Reset" flag exists from a PREVIOUS boot
-if FLAG_FILE in os.listdir():
+if reset_detect.triggered():
     print("!!! Double Reset Detected: Wiping WiFi Credentials !!!")
     
     # Rapid Blink feedback
@@ -20,18 +23,17 @@ if FLAG_FILE in os.listdir():
     try: os.remove(WIFI_FILE)
     except: pass
     
-    try: os.remove(FLAG_FILE)
-    except: pass
+    state.set("has_wifi", False)
+    reset_detect.clear()
     
     machine.reset()
 
 else:
     # 2. First boot attempt: ONLY create the flag if we already have credentials.
     # This prevents the loop when the WiFi Manager reboots after a fresh setup.
-    if WIFI_FILE in os.listdir():
+    if state.get("has_wifi"):
         print("Setting Reset Flag...")
-        with open(FLAG_FILE, "w") as f:
-            f.write("1")
+        reset_detect.arm()
     else:
         print("No WiFi file found. Skipping reset flag (Setup Mode).")
 
@@ -41,3 +43,10 @@ else:
     
     # This will either connect using wifi.dat or start the portal
     wm.connect()
+    bootprof.mark("wifi")
+
+    # Globals from boot.py stay alive under main.py; free the manager now
+    import sys, gc
+    del wm, WifiManager
+    sys.modules.pop("wifimanager", None)
+    gc.collect()
@@ -0,0 +1,86 @@
+# bootprof.py
+# Boot phase timeline: named time.ticks_ms() marks from boot.py through the
+# app. ticks_ms() starts at 0 on reset, so every mark is "ms since reset".
+#
+# Disabled (state key "bootprof" set to false), mark() is an empty function.
+# finish() appends the timeline to a small ring file of the last RING boots:
+#   byte 0: index of the next slot, then RING slots of SLOT bytes each holding
+#   the summary text, zero padded.
+
+import time
+import state
+import fsutil
+
+RING_FILE = "bootprof.dat"
+RING = 8
+SLOT = 120
+
+ENABLED = state.get("bootprof", True)
+
+_marks = []
+_done = False
+
+
+def _noop(name):
+    pass
+
+
+def _mark(name):
+    if not _done:
+        _marks.append((name, time.ticks_ms()))
+
+
+mark = _mark if ENABLED else _noop
+
+
+def summary():
+    """Compact timeline, e.g. "boot:40 wifi:2310 calib:3650 mqtt:9820"."""
+    return " ".join("{}:{}".format(n, t) for n, t in _marks)
+
+
+def _open_ring():
+    try:
+        return open(RING_FILE, "r+b")
+    except OSError:
+        with open(RING_FILE, "wb") as f:
+            f.write(bytes(1 + RING * SLOT))
+        fsutil.count()
+        return open(RING_FILE, "r+b")
+
+
+def finish():
+    """Persists this boot's timeline once. Returns the summary, or None if disabled/already done."""
+    global _done
+    if not ENABLED or _done:
+        return None
+    _done = True
+    text = summary()
+    data = text.encode()[:SLOT]
+    try:
+        with _open_ring() as f:
+            i = f.read(1)[0] % RING
+            f.seek(1 + i * SLOT)
+            f.write(data + bytes(SLOT - len(data)))
+            f.seek(0)
+            f.write(bytes([(i + 1) % RING]))
+        fsutil.count()
+    except Exception as e:
+        print("[Prof] Could not save timeline:", e)
+    return text
+
+
+def history():
+    """Saved timelines, newest first."""
+    out = []
+    try:
+        with open(RING_FILE, "rb") as f:
+            data = f.read()
+    except OSError:
+        return out
+    nxt = data[0]
+    for k in range(1, RING + 1):
+        i = (nxt - k) % RING
+        raw = data[1 + i * SLOT:1 + (i + 1) * SLOT].rstrip(b"\0")
+        if raw:
+            out.append(raw.decode())
+    return out
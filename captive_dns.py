@@ -0,0 +1,109 @@
+# captive_dns.py
+# Captive-portal DNS responder running in the uasyncio loop: every A query is
+# answered with the AP address, so phones open the portal for any hostname.
+#
+# Only the first question is parsed and echoed back (additional records such
+# as EDNS OPT are dropped). A answers come from a template built once; AAAA and
+# other types get an empty NOERROR answer so clients fall back to IPv4.
+
+import socket
+import struct
+import uasyncio as asyncio
+
+PORT = 53
+TTL = 60
+# Recently built responses, keyed by the query minus its id
+CACHE_SIZE = 16
+# Sleep between polls of the socket, only where the loop can't wait on it
+POLL_MS = 20
+
+QTYPE_A = 1
+QCLASS_IN = 1
+
+
+def _wait_readable(sock):
+    # What uasyncio's Stream.read does: park the task until the socket has data
+    yield asyncio.core._io_queue.queue_read(sock)
+
+
+class CaptiveDNS:
+    def __init__(self, ip, debug=False):
+        self.debug = debug
+        # Name pointer to offset 12 (the question), type A, class IN, TTL, 4-byte address
+        self.answer = b"\xc0\x0c" + struct.pack(">HHIH", QTYPE_A, QCLASS_IN, TTL, 4) + bytes([int(p) for p in ip.split(".")])
+        self.buf = bytearray(512)
+        self.cache = {}
+        self.queries = 0
+        self.hits = 0
+
+    def respond(self, data):
+        """Builds the response to query data in self.buf. Returns its length, or 0 to ignore."""
+        n = len(data)
+        if n < 17 or data[2] & 0x80:
+            # Too short to hold a question, or not a query
+            return 0
+        buf = self.buf
+        key = bytes(data[2:])
+        cached = self.cache.get(key)
+        if cached:
+            self.hits += 1
+            size = len(cached)
+            buf[:size] = cached
+            buf[0:2] = data[0:2]
+            return size
+
+        # Walk the labels of the first name; compression pointers can't appear in a query's first name
+        pos = 12
+        while pos < n and data[pos]:
+            if data[pos] & 0xC0:
+                return 0
+            pos += data[pos] + 1
+        end = pos + 5
+        if end > n or end + len(self.answer) > len(buf):
+            return 0
+        qtype, qclass = struct.unpack_from(">HH", data, pos + 1)
+        is_a = qtype == QTYPE_A and qclass == QCLASS_IN
+
+        # Flags: response, opcode 0, authoritative, keep the client's RD bit, recursion available, NOERROR
+        struct.pack_into(">BBHHHH", buf, 2, 0x84 | (data[2] & 0x01), 0x80, 1, 1 if is_a else 0, 0, 0)
+        buf[0:2] = data[0:2]
+        buf[12:end] = data[12:end]
+        size = end
+        if is_a:
+            buf[size:size + len(self.answer)] = self.answer
+            size += len(self.answer)
+
+        if len(self.cache) >= CACHE_SIZE:
+            self.cache = {}
+        self.cache[key] = bytes(buf[:size])
+        return size
+
+    async def serve(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("0.0.0.0", PORT))
+            sock.setblocking(False)
+            if self.debug:
+                print("[dns] started on UDP/{}".format(PORT))
+            mv = memoryview(self.buf)
+            while True:
+                try:
+                    data, addr = sock.recvfrom(512)
+                except OSError:
+                    # Nothing queued (EAGAIN): let the HTTP tasks run
+                    if hasattr(asyncio, "core"):
+                        await _wait_readable(sock)
+                    else:
+                        await asyncio.sleep_ms(POLL_MS)
+                    continue
+                self.queries += 1
+                try:
+                    size = self.respond(data)
+                    if size:
+                        sock.sendto(mv[:size], addr)
+                except Exception as e:
+                    if self.debug:
+                        print("[dns] bad query:", e)
+        finally:
+            sock.close()
@@ -0,0 +1,97 @@
+# codec.py
+# Compact binary payloads for touch/status events, with JSON and plain text fallback
+
+import struct
+import time
+import json
+import ubinascii
+import machine
+
+MAGIC = 0xC7
+VERSION = 1
+
+# Header: magic, version, type, device id, sequence, timestamp (ms)
+HEADER_FMT = ">BBB6sHI"
+HEADER_LEN = struct.calcsize(HEADER_FMT)
+
+# --- MESSAGE TYPES ---
+MSG_TOUCH = 1
+MSG_STATUS = 2
+MSG_GESTURE = 3
+
+# type -> (name, struct format of the body, field names)
+SCHEMAS = {
+    MSG_TOUCH: ("touch", ">H", ("value",)),
+    MSG_STATUS: ("status", ">hHI", ("rssi", "heap_kb", "uptime_s")),
+    # gesture ids are gesture.TAP etc.
+    MSG_GESTURE: ("gesture", ">BH", ("gesture", "duration_ms")),
+}
+
+_dev_id = (machine.unique_id() + bytes(6))[:6]
+_dev_hex = ubinascii.hexlify(_dev_id).decode()
+_seq = [0]
+_buf = bytearray(64)
+
+
+def _next_seq():
+    s = _seq[0]
+    _seq[0] = (s + 1) & 0xFFFF
+    return s
+
+
+def encode(msg_type, *values, ts=None):
+    """Packs a message into the binary wire format. ts defaults to now."""
+    name, fmt, fields = SCHEMAS[msg_type]
+    body_len = struct.calcsize(fmt)
+    if ts is None:
+        ts = time.ticks_ms()
+    struct.pack_into(HEADER_FMT, _buf, 0, MAGIC, VERSION, msg_type,
+                     _dev_id, _next_seq(), ts & 0xFFFFFFFF)
+    struct.pack_into(fmt, _buf, HEADER_LEN, *values)
+    return bytes(_buf[:HEADER_LEN + body_len])
+
+
+def encode_json(msg_type, *values, ts=None):
+    """Same message as encode(), as JSON for consumers that can't read binary."""
+    name, fmt, fields = SCHEMAS[msg_type]
+    msg = {
+        "type": name,
+        "dev": _dev_hex,
+        "seq": _next_seq(),
+        "ts": time.ticks_ms() if ts is None else ts,
+    }
+    for i in range(len(fields)):
+        msg[fields[i]] = values[i]
+    return json.dumps(msg)
+
+
+def decode(payload):
+    """Decodes a payload into a dict. Binary first, then JSON, then plain text."""
+    if len(payload) >= HEADER_LEN and payload[0] == MAGIC:
+        magic, ver, msg_type, dev, seq, ts = struct.unpack_from(HEADER_FMT, payload, 0)
+        schema = SCHEMAS.get(msg_type)
+        if ver == VERSION and schema:
+            name, fmt, fields = schema
+            if len(payload) >= HEADER_LEN + struct.calcsize(fmt):
+                values = struct.unpack_from(fmt, payload, HEADER_LEN)
+                msg = {"type": name, "dev": ubinascii.hexlify(dev).decode(), "seq": seq, "ts": ts}
+                for i in range(len(fields)):
+                    msg[fields[i]] = values[i]
+                return msg
+
+    try:
+        text = payload.decode()
+    except:
+        return {"type": "raw", "data": payload}
+
+    if text and text[0] in "{[":
+        try:
+            msg = json.loads(text)
+            if isinstance(msg, dict):
+                msg.setdefault("type", "json")
+                return msg
+            return {"type": "json", "data": msg}
+        except:
+            pass
+
+    return {"type": "text", "text": text}
@@ -0,0 +1,205 @@
+# config_store.py
+# Versioned binary config file with an offset index, so single fields can be
+# read without decrypting and parsing the whole config.
+#
+# Layout of config.bin:
+#   b"CFG" + version (1 byte) + field count (1 byte)
+#   index, per field: key length (1), key, type (1), offset (2), length (2)
+#   data: each value encrypted on its own with crypto.xor (key stream from 0),
+#         so blobs can be copied verbatim when another field is rewritten
+
+import os
+import json
+import struct
+import crypto
+import fsutil
+
+STORE_FILE = "config.bin"
+MAGIC = b"CFG"
+VERSION = 1
+
+T_STR = 1
+T_JSON = 2
+
+DEFAULTS = {
+    "url": "",
+    "user": "",
+    "pass": "",
+    "sub_topics": [],
+    "pub_topic": "touch",
+    "versions": {},
+    "github_url": "",
+}
+
+
+class ConfigStore:
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self._index = None
+
+    # -----------------
+    # Index
+    # -----------------
+    def _read_index(self, path):
+        index = {}
+        with open(path, "rb") as f:
+            head = f.read(5)
+            if head[:3] != MAGIC or head[3] != VERSION:
+                raise ValueError("Bad config header")
+            for _ in range(head[4]):
+                klen = f.read(1)[0]
+                key = f.read(klen).decode()
+                t, off, length = struct.unpack(">BHH", f.read(5))
+                index[key] = (t, off, length)
+        return index
+
+    def _complete(self, tmp):
+        # Every field the index points at has to be in the file
+        size = os.stat(tmp)[6]
+        for t, off, length in self._read_index(tmp).values():
+            if off + length > size:
+                return False
+        return True
+
+    def _recover(self):
+        fsutil.recover(self.path, self._complete, "[Config]")
+
+    def _load_index(self):
+        self._recover()
+        try:
+            index = self._read_index(self.path)
+        except OSError:
+            index = {}
+        except Exception as e:
+            # Corrupt or truncated: run on defaults rather than fail the import
+            print("[Config] Unreadable", self.path + ":", e)
+            index = {}
+        self._index = index
+        return index
+
+    def _idx(self):
+        return self._index if self._index is not None else self._load_index()
+
+    def exists(self):
+        self._recover()
+        try:
+            os.stat(self.path)
+            return True
+        except OSError:
+            return False
+
+    def keys(self):
+        return list(self._idx().keys())
+
+    # -----------------
+    # Reads
+    # -----------------
+    def _read_raw(self, f, off, length):
+        f.seek(off)
+        return f.read(length)
+
+    def get(self, key, default=None):
+        entry = self._idx().get(key)
+        if entry is None:
+            return DEFAULTS.get(key, default) if default is None else default
+        t, off, length = entry
+        with open(self.path, "rb") as f:
+            raw = crypto.xor(self._read_raw(f, off, length)).decode()
+        return raw if t == T_STR else json.loads(raw)
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    # -----------------
+    # Writes
+    # -----------------
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, fields):
+        """Rewrites the file with the given fields changed; tmp + rename so it's all-or-nothing."""
+        old = self._idx()
+        blobs = {}
+        for key, value in fields.items():
+            if isinstance(value, str):
+                blobs[key] = (T_STR, crypto.xor(value))
+            else:
+                blobs[key] = (T_JSON, crypto.xor(json.dumps(value)))
+
+        keys = [k for k in old if k not in blobs] + list(blobs.keys())
+        if len(keys) > 255:
+            raise ValueError("Too many config fields")
+
+        # Work out the new layout before writing anything
+        head_len = 5
+        for k in keys:
+            head_len += 1 + len(k.encode()) + 5
+        layout = []
+        off = head_len
+        for k in keys:
+            if k in blobs:
+                t, length = blobs[k][0], len(blobs[k][1])
+            else:
+                t, _, length = old[k]
+            layout.append((k, t, off, length))
+            off += length
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as out:
+            out.write(MAGIC + bytes([VERSION, len(keys)]))
+            for k, t, o, length in layout:
+                kb = k.encode()
+                out.write(bytes([len(kb)]) + kb + struct.pack(">BHH", t, o, length))
+            src = open(self.path, "rb") if any(k not in blobs for k in keys) else None
+            try:
+                for k, t, o, length in layout:
+                    if k in blobs:
+                        out.write(blobs[k][1])
+                    else:
+                        out.write(self._read_raw(src, old[k][1], length))
+            finally:
+                if src:
+                    src.close()
+        fsutil.count()
+        fsutil.replace(tmp, self.path)
+
+        index = {}
+        for k, t, o, length in layout:
+            index[k] = (t, o, length)
+        self._index = index
+
+    # -----------------
+    # Migration from config.dat / config.json
+    # -----------------
+    def migrate(self):
+        """Imports a legacy config into the store once. Returns True if one was imported.
+
+        The legacy file is left in place: led_touch.py, which the same OTA
+        installs, still reads config.json."""
+        if self.exists():
+            return False
+        cfg = None
+        try:
+            with open("config.dat", "rb") as f:
+                cfg = json.load(crypto.Reader(f))
+            legacy = "config.dat"
+        except OSError:
+            pass
+        except Exception as e:
+            print("[Config] Failed to decrypt config.dat:", e)
+        if cfg is None:
+            try:
+                with open("config.json") as f:
+                    cfg = json.load(f)
+                legacy = "config.json"
+            except OSError:
+                pass
+            except Exception as e:
+                print("[Config] Failed to read config.json:", e)
+        if cfg is None:
+            print("[Config] CRITICAL: No config found.")
+            return False
+
+        self.update(cfg)
+        print("[Config] Migrated", legacy, "to", self.path)
+        return True
@@ -0,0 +1,179 @@
+# crypto.py
+# Device-keyed stream cipher for config and credential files.
+#
+# MODE_XOR is the original scheme (data XOR machine.unique_id(), repeating) so
+# existing config.dat / wifi.dat files keep working. MODE_AES uses cryptolib
+# AES-CTR, hardware accelerated on the ESP32, with a key derived from the
+# device id; those files start with AES_MAGIC followed by a 16-byte IV.
+
+import io
+import os
+import machine
+import hashlib
+
+MODE_XOR = 0
+MODE_AES = 1
+
+AES_MAGIC = b"AC1"
+_AES_CTR = 6
+
+# Mode used for newly written files
+DEFAULT_MODE = MODE_XOR
+
+CHUNK = 256
+
+KEY = machine.unique_id()
+
+try:
+    import cryptolib
+except ImportError:
+    cryptolib = None
+
+
+def _xor_py(buf, n, key, klen, k):
+    for i in range(n):
+        buf[i] ^= key[k]
+        k += 1
+        if k == klen:
+            k = 0
+
+
+try:
+    import micropython
+
+    @micropython.viper
+    def _xor_viper(buf: ptr8, n: int, key: ptr8, klen: int, k: int):
+        i = 0
+        while i < n:
+            buf[i] = buf[i] ^ key[k]
+            k += 1
+            if k == klen:
+                k = 0
+            i += 1
+
+    _xor = _xor_viper
+except Exception:
+    _xor = _xor_py
+
+
+def xor_into(buf, n, offset=0):
+    """XORs buf[:n] in place with the device key stream starting at offset."""
+    _xor(buf, n, KEY, len(KEY), offset % len(KEY))
+
+
+def xor(data, offset=0):
+    """Returns data XOR the device key stream. For short blobs (e.g. one credential line)."""
+    if isinstance(data, str):
+        data = data.encode()
+    buf = bytearray(data)
+    xor_into(buf, len(buf), offset)
+    return bytes(buf)
+
+
+def _aes_key():
+    return hashlib.sha256(b"christmas-gift" + KEY).digest()[:16]
+
+
+class Reader(io.IOBase):
+    """Decrypting read stream over an open binary file; works with json.load()."""
+    def __init__(self, f):
+        self.f = f
+        self.pos = 0
+        self.aes = None
+        self._head = b""
+        head = f.read(len(AES_MAGIC))
+        if head == AES_MAGIC and cryptolib:
+            self.aes = cryptolib.aes(_aes_key(), _AES_CTR, f.read(16))
+        else:
+            self._head = head
+
+    def readinto(self, buf):
+        mv = memoryview(buf)
+        n = 0
+        if self._head:
+            n = min(len(buf), len(self._head))
+            mv[:n] = self._head[:n]
+            self._head = self._head[n:]
+        if n < len(buf):
+            r = self.f.readinto(mv[n:])
+            if r:
+                n += r
+        if not n:
+            return 0
+        if self.aes:
+            self.aes.decrypt(mv[:n], mv[:n])
+        else:
+            xor_into(mv, n, self.pos)
+        self.pos += n
+        return n
+
+    def read(self, size=-1):
+        out = bytearray()
+        buf = bytearray(CHUNK)
+        while size < 0 or len(out) < size:
+            want = CHUNK if size < 0 else min(CHUNK, size - len(out))
+            n = self.readinto(memoryview(buf)[:want])
+            if not n:
+                break
+            out += buf[:n]
+        return bytes(out)
+
+
+class Writer(io.IOBase):
+    """Encrypting write stream over an open binary file; works with json.dump()."""
+    def __init__(self, f, mode=None):
+        self.f = f
+        self.pos = 0
+        self.aes = None
+        self.buf = bytearray(CHUNK)
+        if mode is None:
+            mode = DEFAULT_MODE
+        if mode == MODE_AES and cryptolib:
+            iv = os.urandom(16)
+            f.write(AES_MAGIC)
+            f.write(iv)
+            self.aes = cryptolib.aes(_aes_key(), _AES_CTR, iv)
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        src = memoryview(data)
+        out = memoryview(self.buf)
+        done = 0
+        while done < len(src):
+            n = min(len(self.buf), len(src) - done)
+            if self.aes:
+                self.aes.encrypt(src[done:done + n], out[:n])
+            else:
+                out[:n] = src[done:done + n]
+                xor_into(out, n, self.pos)
+            self.f.write(out[:n])
+            self.pos += n
+            done += n
+        return len(data)
+
+
+def encrypt_file(src, dst, mode=None):
+    """Streams plaintext file src into encrypted file dst in CHUNK-sized pieces."""
+    buf = bytearray(CHUNK)
+    mv = memoryview(buf)
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        w = Writer(fout, mode)
+        while True:
+            n = fin.readinto(buf)
+            if not n:
+                break
+            w.write(mv[:n])
+
+
+def decrypt_file(src, dst):
+    """Streams encrypted file src (either mode) into plaintext file dst."""
+    buf = bytearray(CHUNK)
+    mv = memoryview(buf)
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        r = Reader(fin)
+        while True:
+            n = r.readinto(buf)
+            if not n:
+                break
+            fout.write(mv[:n])
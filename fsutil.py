@@ -0,0 +1,48 @@
+# fsutil.py
+# Flash file helpers shared by state.py, config_store.py and bootprof.py:
+# replacing a file in one step, recovering from a crash halfway through on FAT,
+# and counting the writes those modules make.
+
+import os
+
+# Files written and renames/removes since boot, for flash wear accounting
+writes = 0
+
+
+def count(n=1):
+    global writes
+    writes += n
+
+
+def replace(tmp, path):
+    """Moves the finished tmp file over path. Writing tmp is the caller's to count."""
+    try:
+        # littlefs replaces the old file in one step
+        os.rename(tmp, path)
+    except OSError:
+        # FAT won't rename over a file; recover() covers a crash in between
+        os.remove(path)
+        os.rename(tmp, path)
+        count()
+    count()
+
+
+def recover(path, complete, tag):
+    """Restores path from path + ".tmp" when replace() died between the remove
+    and the rename. complete(tmp) must say whether the tmp file was fully
+    written; a torn one from an interrupted write is left alone. Returns True
+    if path was restored."""
+    try:
+        os.stat(path)
+        return False
+    except OSError:
+        pass
+    tmp = path + ".tmp"
+    try:
+        if not complete(tmp):
+            return False
+    except Exception:
+        return False
+    os.rename(tmp, path)
+    print(tag, "Recovered", path, "from", tmp)
+    return True
@@ -0,0 +1,140 @@
+# gesture.py
+# Tap / double-tap / long-press recognition on top of touch.TouchEngine's
+# press and release events.
+#
+# Timing comes from the sample stamps on each event, and timeouts are decided
+# against the stamp of the last sample the engine has processed, never against
+# the clock: an edge still waiting in the ring can't turn a tap into a long
+# press. A busy loop delays gestures but doesn't change them:
+#   tap         released before LONG_MS, no second press within DOUBLE_MS
+#   double_tap  second press within DOUBLE_MS of a tap, released before LONG_MS
+#   long_press  held for LONG_MS; fires while the pad is still held
+#   release     every release, with how long the pad was held
+#
+# A single tap has to wait out DOUBLE_MS in case a second one follows. With
+# double=False nothing waits for it and taps fire on release.
+#
+# Events are (gesture, ticks_ms, duration_ms) on self.events.
+
+import time
+import uasyncio as asyncio
+from touch import EventQueue, PRESS, RELEASE
+
+LONG_MS = 600
+DOUBLE_MS = 250
+
+TAP = 1
+DOUBLE_TAP = 2
+LONG_PRESS = 3
+RELEASE_GESTURE = 4
+
+NAMES = {
+    TAP: "tap",
+    DOUBLE_TAP: "double_tap",
+    LONG_PRESS: "long_press",
+    RELEASE_GESTURE: "release",
+}
+
+# States
+_IDLE = 0
+_DOWN = 1
+_WAIT = 2   # tapped once, waiting for a second press
+_DOWN2 = 3
+_LONG = 4   # long_press sent, waiting for the release
+
+
+class GestureRecognizer:
+    def __init__(self, long_ms=LONG_MS, double_ms=DOUBLE_MS, double=True):
+        self.long_ms = long_ms
+        self.double_ms = double_ms
+        self.double = double
+        self.events = EventQueue()
+        self.reset()
+
+    def reset(self):
+        self.state = _IDLE
+        self.held = False
+        self.t_down = 0
+        self.t_up = 0
+        # Press time of the first tap of a possible double tap
+        self.t_first = 0
+        self.tap_ms = 0
+
+    def _emit(self, gesture, t, duration):
+        self.events.put((gesture, t, duration))
+
+    # -----------------
+    # Edges and timeouts
+    # -----------------
+    def feed(self, kind, t):
+        """Handles one PRESS/RELEASE from the touch engine, stamped t."""
+        # Settle timeouts that expired before this edge first
+        self.poll(t)
+        if kind == PRESS:
+            self.held = True
+            self.t_down = t
+            self.state = _DOWN2 if self.state == _WAIT else _DOWN
+        elif kind == RELEASE and self.held:
+            self.held = False
+            held = time.ticks_diff(t, self.t_down)
+            self._emit(RELEASE_GESTURE, t, held)
+            if self.state == _DOWN:
+                if self.double:
+                    self.state = _WAIT
+                    self.t_up = t
+                    self.t_first = self.t_down
+                    self.tap_ms = held
+                    return
+                self._emit(TAP, t, held)
+            elif self.state == _DOWN2:
+                self._emit(DOUBLE_TAP, t, time.ticks_diff(t, self.t_first))
+            self.state = _IDLE
+
+    def poll(self, now):
+        """Fires the gestures that are decided by time passing rather than an edge."""
+        state = self.state
+        if state == _DOWN or state == _DOWN2:
+            if time.ticks_diff(now, self.t_down) >= self.long_ms:
+                if state == _DOWN2:
+                    # The first tap stands on its own
+                    self._emit(TAP, self.t_up, self.tap_ms)
+                self._emit(LONG_PRESS, time.ticks_add(self.t_down, self.long_ms), self.long_ms)
+                self.state = _LONG
+        elif state == _WAIT:
+            if time.ticks_diff(now, self.t_up) > self.double_ms:
+                self._emit(TAP, self.t_up, self.tap_ms)
+                self.state = _IDLE
+
+    def deadline(self, now):
+        """ms until poll() may have something to fire, or None if only an edge can change the state."""
+        state = self.state
+        if state == _DOWN or state == _DOWN2:
+            return max(0, self.long_ms - time.ticks_diff(now, self.t_down))
+        if state == _WAIT:
+            return max(0, self.double_ms + 1 - time.ticks_diff(now, self.t_up))
+        return None
+
+    async def run(self, engine):
+        """Consumes the touch events of engine (a touch.TouchEngine) until cancelled."""
+        events = engine.events
+        while True:
+            # Bring the engine up to date first, so every edge before its stamp is queued
+            engine.drain()
+            item = events.get_nowait()
+            while item:
+                self.feed(item[0], item[2])
+                item = events.get_nowait()
+            wait = self.deadline(engine.stamp)
+            if wait == 0:
+                self.poll(engine.stamp)
+                continue
+            if wait is None:
+                kind, _, t = await events.get()
+                self.feed(kind, t)
+                continue
+            # Samples trail the clock by up to a period; waking sooner finds nothing new
+            try:
+                kind, _, t = await asyncio.wait_for(events.get(), max(wait, engine.period_ms) / 1000)
+                self.feed(kind, t)
+            except asyncio.TimeoutError:
+                pass
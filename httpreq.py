@@ -0,0 +1,173 @@
+# httpreq.py
+# Incremental HTTP/1.1 request parser for the portal's asyncio server.
+#
+# Reads fixed-size chunks from the stream and splits lines as they arrive, so
+# a request costs one pass over its bytes. Every part is bounded: a line longer
+# than MAX_LINE, more than MAX_HEADERS headers or a body over MAX_BODY ends the
+# request with an HTTPError carrying the status to answer with. Bytes after the
+# end of a request are kept for the next one on a keep-alive connection.
+
+import uasyncio as asyncio
+
+READ_SIZE = 256
+MAX_LINE = 512
+MAX_HEADERS = 32
+MAX_BODY = 1024
+
+# Only these headers are kept; the rest are skipped as they stream past
+KEEP_HEADERS = (b'host', b'connection', b'content-length', b'content-type', b'if-none-match',
+                b'accept-encoding')
+
+FORM_TYPE = 'application/x-www-form-urlencoded'
+
+
+class HTTPError(Exception):
+    def __init__(self, status, msg=''):
+        super().__init__(msg)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, target, headers):
+        self.method = method
+        path, _, query = target.partition('?')
+        self.path = path
+        self.query = parse_qs(query)
+        self.headers = headers
+        self.host = headers.get('host', '')
+        self.form = {}
+
+    def params(self):
+        """Form fields for a POST, query parameters otherwise."""
+        return self.form if self.method == 'POST' else self.query
+
+    def keep_alive(self):
+        return self.headers.get('connection', '').lower() != 'close'
+
+
+class RequestParser:
+    """One per connection: next() returns each request in turn, or None once the client is done."""
+    def __init__(self, reader, timeout=5):
+        self.reader = reader
+        self.timeout = timeout
+        self.pending = b''
+
+    async def _fill(self, timeout):
+        chunk = await asyncio.wait_for(self.reader.read(READ_SIZE), timeout)
+        if not chunk:
+            return False
+        self.pending += chunk
+        return True
+
+    async def _line(self, timeout, too_long):
+        while True:
+            i = self.pending.find(b'\n')
+            if i > MAX_LINE:
+                raise HTTPError(too_long, "line too long")
+            if i >= 0:
+                line = self.pending[:i]
+                self.pending = self.pending[i + 1:]
+                return line[:-1] if line.endswith(b'\r') else line
+            if len(self.pending) > MAX_LINE:
+                raise HTTPError(too_long, "line too long")
+            if not await self._fill(timeout):
+                if self.pending:
+                    raise HTTPError(400, "truncated request")
+                return None
+
+    async def next(self, first_timeout=None):
+        # Skip stray blank lines between pipelined requests
+        line = b''
+        while not line:
+            line = await self._line(first_timeout or self.timeout, 414)
+            if line is None:
+                return None
+        parts = line.split()
+        if len(parts) != 3 or not parts[2].startswith(b'HTTP/'):
+            raise HTTPError(400, "bad request line")
+
+        headers = {}
+        count = 0
+        while True:
+            h = await self._line(self.timeout, 431)
+            if h is None:
+                raise HTTPError(400, "truncated headers")
+            if not h:
+                break
+            count += 1
+            if count > MAX_HEADERS:
+                raise HTTPError(431, "too many headers")
+            k, _, v = h.partition(b':')
+            k = k.strip().lower()
+            if k in KEEP_HEADERS:
+                headers[k.decode()] = v.strip().decode('utf-8', 'ignore')
+
+        req = Request(parts[0].decode(), parts[1].decode('utf-8', 'ignore'), headers)
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400, "bad content-length")
+        if length > MAX_BODY:
+            raise HTTPError(413, "body too large")
+        if length:
+            while len(self.pending) < length:
+                if not await self._fill(self.timeout):
+                    raise HTTPError(400, "truncated body")
+            body = self.pending[:length]
+            self.pending = self.pending[length:]
+            if headers.get('content-type', '').split(';')[0].strip() == FORM_TYPE:
+                req.form = parse_qs(body)
+        return req
+
+
+def parse_qs(data):
+    """Parses "a=1&b=two" (str or bytes) into {"a": "1", "b": "two"}, URL-decoding both sides."""
+    out = {}
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    for pair in data.split(b'&'):
+        if not pair:
+            continue
+        k, _, v = pair.partition(b'=')
+        try:
+            out[url_decode(k).decode('utf-8')] = url_decode(v).decode('utf-8')
+        except UnicodeError:
+            continue
+    return out
+
+
+def url_decode(url_string):
+    if not url_string:
+        return b''
+    if isinstance(url_string, str):
+        url_string = url_string.encode('utf-8')
+    url_string = url_string.replace(b'+', b' ')
+    bits = url_string.split(b'%')
+    if len(bits) == 1:
+        return url_string
+    res = [bits[0]]
+    appnd = res.append
+    hextobyte_cache = {}
+    for item in bits[1:]:
+        try:
+            code = item[:2]
+            char = hextobyte_cache.get(code)
+            if char is None:
+                char = hextobyte_cache[code] = bytes([int(code, 16)])
+            appnd(char)
+            appnd(item[2:])
+        except:
+            appnd(b'%')
+            appnd(item)
+    return b''.join(res)
+
+
+def url_encode(text):
+    out = []
+    for b in text.encode('utf-8'):
+        c = chr(b)
+        if b < 128 and (c.isalpha() or c.isdigit() or c in '-_.~'):
+            out.append(c)
+        else:
+            out.append('%{:02X}'.format(b))
+    return ''.join(out)
@@ -3,6 +3,29 @@ from ws_mqtt import MQTTWebSocketClient
 import uasyncio as asyncio
 import math, time, os, gc, json
 
+# OTA ships only this file and main.py, so an older updater can install it
+# next to boot files that predate these modules
+try:
+    import reset_detect
+except ImportError:
+    reset_detect = None
+try:
+    import bootprof
+except ImportError:
+    bootprof = None
+try:
+    import slots
+except ImportError:
+    slots = None
+try:
+    import codec
+except ImportError:
+    codec = None
+try:
+    import touch
+except ImportError:
+    touch = None
+
 # --- 1. CONFIG & GLOBALS ---
 def load_config():
     try:
@@ -14,6 +37,10 @@ def load_config():
 # Configuration
 CONFIG = load_config()
 publish_deadline = 0
+# Minimum ms between touch publishes. Polling sees a held pad on every pass, so
+# it needs a long lockout; touch.TouchEngine reports each press once.
+POLL_PUBLISH_MS = 5000
+PRESS_PUBLISH_MS = 300
 mqtt_state = [0] # [pulse_deadline_ticks]
 status = {'touch_active': False}
 TOPICS = []
@@ -23,9 +50,20 @@ for topic in CONFIG['sub_topics']:
 
 async def clear_reset_flag():
     await asyncio.sleep(5)
+    # Reaching this point means the running slot is healthy
+    if slots:
+        try:
+            slots.mark_stable()
+        except Exception as e:
+            print("[Slots] Could not mark stable:", e)
     try:
-        if ".reset_flag" in os.listdir():
-            os.remove(".reset_flag")
+        if reset_detect:
+            cleared = reset_detect.clear()
+        else:
+            cleared = ".reset_flag" in os.listdir()
+            if cleared:
+                os.remove(".reset_flag")
+        if cleared:
             print("[System] Stable. Reset flag cleared")
     except Exception as e:
         print("[System] Error clearing flag: ", e)
@@ -43,10 +81,35 @@ async def calibrate_touch(touch_pin, samples=20):
     return threshold
 
 async def on_msg(topic, payload):
-    # Added print for debugging
-    print(f"[MQTT] Message received! Topic: {topic.decode()}, Payload: {payload.decode()}")
-    # Existing logic for extending the pulse deadline
+    # Extend the pulse deadline first: whatever the payload, it still lights up
     mqtt_state[0] = time.ticks_add(time.ticks_ms(), 5000)
+    # Binary codec payloads aren't UTF-8; decode() alone would raise on them
+    if codec:
+        msg = codec.decode(payload)
+    else:
+        try:
+            msg = payload.decode()
+        except UnicodeError:
+            msg = payload
+    print(f"[MQTT] Message received! Topic: {topic.decode()}, Payload: {msg}")
+
+async def touch_events(engine, client):
+    # Debounced press/release events from touch.TouchEngine
+    global publish_deadline
+    while True:
+        kind, value, _ = await engine.events.get()
+        status['touch_active'] = kind == touch.PRESS
+        if kind != touch.PRESS or not client._connected:
+            continue
+        if time.ticks_diff(time.ticks_ms(), publish_deadline) > 0:
+            try:
+                print(f"[MQTT] Publishing touch event: {value}")
+                await client.publish(CONFIG['pub_topic'], str(value))
+                publish_deadline = time.ticks_add(time.ticks_ms(), PRESS_PUBLISH_MS)
+            except Exception as e:
+                print(f"[MQTT] Publish Error: {e}")
+                # Mark as disconnected so the supervisor fixes it
+                client._connected = False
 
 async def pulse_led(led_pwm):
     phase = 0
@@ -73,7 +136,19 @@ async def example():
     led_pwm = PWM(leds)
     led_pwm.freq(500)
 
-    touch_threshold = await calibrate_touch(touch_pin)
+    if bootprof:
+        bootprof.mark("app")
+    if touch:
+        # Sampled off a hardware timer; the baseline seeds itself and tracks drift
+        engine = touch.TouchEngine(touch_pin)
+        engine.start()
+        asyncio.create_task(engine.run())
+        touch_threshold = None
+    else:
+        # touch.py not installed: fixed threshold, polled from the loop below
+        touch_threshold = await calibrate_touch(touch_pin)
+    if bootprof:
+        bootprof.mark("calib")
     
     # Initialize MQTT Client with aggressive 30s KeepAlive for Cloudflare
     client = MQTTWebSocketClient(
@@ -86,8 +161,11 @@ async def example():
     client.set_callback(on_msg)
 
     asyncio.create_task(pulse_led(led_pwm))
+    if touch:
+        asyncio.create_task(touch_events(engine, client))
 
-    print("[System] Starting Main Loop...")
+    gc.collect()
+    print("[System] Starting Main Loop... free heap:", gc.mem_free())
     loop_count = 0
 
     while True:
@@ -102,6 +180,11 @@ async def example():
                 for topic in TOPICS:
                     await client.subscribe(topic)
                 print(f"[MQTT] Connected and Subscribed to {TOPICS}")
+                if bootprof:
+                    bootprof.mark("mqtt")
+                    timeline = bootprof.finish()
+                    if timeline:
+                        await client.publish(CONFIG['pub_topic'] + "/boot", timeline)
                 gc.collect()
             except Exception as e:
                 print(f"[MQTT] Connection failed: {e}. Retrying in 5s...")
@@ -109,6 +192,11 @@ async def example():
                 await asyncio.sleep(5)
                 continue
 
+        if touch:
+            # Touch runs in its own tasks; this loop only supervises MQTT
+            await asyncio.sleep_ms(500)
+            continue
+
         # 2. Handle Touch Logic
         try:
             try:
@@ -123,7 +211,7 @@ async def example():
                 if time.ticks_diff(time.ticks_ms(), publish_deadline) > 0:
                     print(f"[MQTT] Publishing touch event: {data}")
                     await client.publish(CONFIG['pub_topic'], str(data))
-                    publish_deadline = time.ticks_add(time.ticks_ms(), 5000)
+                    publish_deadline = time.ticks_add(time.ticks_ms(), POLL_PUBLISH_MS)
             else:
                 status['touch_active'] = False
 
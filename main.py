@@ -1,4 +1,10 @@
 import uasyncio
+try:
+    import bootprof
+    bootprof.mark("main")
+except ImportError:
+    # Installed by an updater that doesn't ship bootprof.py
+    pass
 from led_touch import example
 
 uasyncio.run(example())
@@ -1,28 +1,36 @@
 import machine
 import os
 import time
+t_boot = time.ticks_ms()
+import state
+import fsutil
+import bootprof
+bootprof.mark("boot")
+import reset_detect
+import slots
 
-FLAG_FILE = ".reset_flag"
 WIFI_FILE = "wifi.dat"
-OTA_FLAG = ".ota_running"
 
 led = machine.Pin(33, machine.Pin.OUT)
 
+# --- OTA SLOT ---
+# Counts trial boots of a freshly activated slot (rolling back if it never
+# reached stable) and puts the active slot first on sys.path.
+slots.boot_check()
+
 # --- OTA BOOT ---
-if OTA_FLAG in os.listdir():
+# Boot flags all live in the state journal (see state.py): one read at
+# import, then dict lookups instead of a listdir per check.
+if state.get("ota_running"):
     print("[System] Post-OTA boot.")
-    try:
-        os.remove(OTA_FLAG)
-        if FLAG_FILE in os.listdir():
-            os.remove(FLAG_FILE)
-    except:
-        pass
+    state.delete("ota_running")
+    reset_detect.clear()
 
     # 🔴 Allow WiFi stack to stabilize
     time.sleep(2)
 
 # --- DOUBLE RESET ---
-elif FLAG_FILE in os.listdir():
+elif reset_detect.triggered():
     print("[System] Double reset detected. Wiping WiFi.")
 
     for _ in range(15):
@@ -35,23 +43,22 @@ elif FLAG_FILE in os.listdir():
         os.remove(WIFI_FILE)
     except:
         pass
-
-    try:
-        os.remove(FLAG_FILE)
-    except:
-        pass
+    state.set("has_wifi", False)
+    reset_detect.clear()
 
     machine.reset()
 
 # --- NORMAL BOOT ---
 else:
-    if WIFI_FILE in os.listdir():
+    if state.get("has_wifi"):
         print("[System] Setting reset flag.")
-        with open(FLAG_FILE, "w") as f:
-            f.write("1")
+        reset_detect.arm()
     else:
         print("[System] No WiFi config found.")
 
+bootprof.mark("state")
+print("[System] Boot state decided in", time.ticks_diff(time.ticks_ms(), t_boot), "ms,", fsutil.writes, "flash writes.")
+
 # --- WIFI CONNECT ---
 from wifimanager import WifiManager
 wm = WifiManager(
@@ -61,3 +68,13 @@ wm = WifiManager(
     debug=True
 )
 wm.connect()
+bootprof.mark("wifi")
+if wm.connect_ms is not None:
+    print("[System] Time to IP:", time.ticks_diff(time.ticks_ms(), t_boot), "ms since boot,", wm.connect_ms, "ms in connect (" + wm.connect_path + ")")
+
+# boot.py globals outlive boot; the app never needs the manager again
+import sys
+import gc
+del wm, WifiManager
+sys.modules.pop("wifimanager", None)
+gc.collect()
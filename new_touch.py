@@ -1,125 +1,175 @@
+import time
+T_IMPORT = time.ticks_ms()
+# Seconds; ticks_ms wraps too soon for an uptime
+T_BOOT = time.time()
 from machine import TouchPad, Pin, PWM
 from ws_mqtt import MQTTWebSocketClient
 import uasyncio as asyncio
-import math, time, os, gc, json
+import math, gc, json, sys
 import machine
 import network
-from ota import OTAUpdater
+import codec
+import slots
+import reset_detect
+import bootprof
+import gesture
+from touch import TouchEngine
+from config_store import ConfigStore
 
 FILES_TO_UPDATE = ["main.py", "led_touch.py"]
+# Loaded only while an update runs (see run_ota), then dropped again
+OTA_MODULES = ("ota", "ahttp")
 
 # --- CONFIG ---
-def load_config():
-    def _decrypt(data):
-        key = machine.unique_id()
-        return bytes([data[i] ^ key[i % len(key)] for i in range(len(data))])
+# Fields are read from config.bin on demand; nothing else is kept in RAM
+CONFIG = ConfigStore()
+CONFIG.migrate()
+TOPICS = CONFIG.get("sub_topics")
+GITHUB_URL = CONFIG.get("github_url")
+PUB_TOPIC = CONFIG.get("pub_topic")
+# Boot timeline (see bootprof.py) is published here once per boot
+BOOT_TOPIC = CONFIG.get("boot_topic", PUB_TOPIC + "/boot")
+# Status (rssi, heap, uptime) is published here after every connect
+STATUS_TOPIC = CONFIG.get("status_topic", PUB_TOPIC + "/status")
+# "json", or "bin" (compact struct codec) once every subscriber decodes it;
+# led_touch.py before the codec crashes on binary payloads
+PAYLOAD_FORMAT = CONFIG.get("payload_format", "json")
 
-    if "config.dat" in os.listdir():
-        try:
-            with open("config.dat", "rb") as f:
-                raw = f.read()
-            decrypted = _decrypt(raw).decode()
-            print("[System] Loaded encrypted config.")
-            return json.loads(decrypted)
-        except Exception as e:
-            print("[System] Failed to decrypt config.dat:", e)
-
-    if "config.json" in os.listdir():
-        try:
-            print("[System] Loading plaintext config.json")
-            with open("config.json") as f:
-                return json.load(f)
-        except Exception as e:
-            print("[System] Failed to read config.json:", e)
-
-    print("[System] CRITICAL: No config found.")
-    return {
-        "url": "",
-        "user": "",
-        "pass": "",
-        "sub_topics": [],
-        "pub_topic": "touch",
-        "versions": {},
-        "github_url": ""
+# --- GESTURES ---
+# Per gesture: MQTT topic and minimum ms between publishes; None leaves it unpublished.
+# The "gestures" config field overrides entries, e.g.
+#   {"long_press": {"topic": "home/alarm", "rate_ms": 5000}, "tap": null}
+def gesture_routes():
+    routes = {
+        "tap": {"topic": PUB_TOPIC, "rate_ms": 300},
+        "double_tap": {"topic": PUB_TOPIC + "/double", "rate_ms": 300},
+        "long_press": {"topic": PUB_TOPIC + "/long", "rate_ms": 1000},
+        "release": None,
     }
+    for name, route in CONFIG.get("gestures", {}).items():
+        if route:
+            # Partial entries keep the defaults they don't mention
+            merged = dict(routes.get(name) or {"topic": PUB_TOPIC + "/" + name, "rate_ms": 0})
+            merged.update(route)
+            route = merged
+        routes[name] = route
+    return routes
+
+GESTURE_ROUTES = gesture_routes()
 
-CONFIG = load_config()
-TOPICS = CONFIG.get("sub_topics", [])
-GITHUB_URL = CONFIG.get("github_url", "")
+T_IMPORT = time.ticks_diff(time.ticks_ms(), T_IMPORT)
 
 client = None
-publish_deadline = 0
+# gesture name -> ticks before which it isn't published again
+gesture_deadline = {}
 mqtt_state = [0]
-status = {"touch_active": False}
+ota_state = {"busy": False}
 
 last_connect_time = 0
 
 # --- HELPERS ---
-def ensure_wifi():
+def unload(names):
+    for name in names:
+        sys.modules.pop(name, None)
+    gc.collect()
+
+async def ensure_wifi():
     wlan = network.WLAN(network.STA_IF)
     wlan.active(True)
     for _ in range(20):
         if wlan.isconnected():
             return True
-        time.sleep(0.5)
+        await asyncio.sleep_ms(500)
     return False
 
 async def clear_reset_flag():
     await asyncio.sleep(5)
+    # Reaching this point means the running slot is healthy
     try:
-        if ".reset_flag" in os.listdir():
-            os.remove(".reset_flag")
-            print("[System] Reset flag cleared.")
+        slots.mark_stable()
+    except Exception as e:
+        print("[Slots] Could not mark stable:", e)
+    if reset_detect.clear():
+        print("[System] Reset flag cleared.")
+
+def encode_msg(msg_type, *values, ts=None):
+    if PAYLOAD_FORMAT == "json":
+        return codec.encode_json(msg_type, *values, ts=ts)
+    return codec.encode(msg_type, *values, ts=ts)
+
+def encode_gesture(g, t, duration):
+    return encode_msg(codec.MSG_GESTURE, g, min(duration, 0xFFFF), ts=t)
+
+def encode_status():
+    try:
+        rssi = network.WLAN(network.STA_IF).status("rssi")
+    except:
+        rssi = 0
+    return encode_msg(codec.MSG_STATUS, rssi, min(gc.mem_free() // 1024, 0xFFFF),
+                      time.time() - T_BOOT)
+
+def parse_update_cmd(payload):
+    """tree/cmd/update carries a full manifest, {"sha256": ...} of one, a bare hex digest, or nothing."""
+    try:
+        text = payload.decode().strip()
+    except UnicodeError:
+        # Not a manifest or a digest; run a normal conditional check
+        text = ""
+    try:
+        cmd = json.loads(text)
+    except:
+        cmd = text
+    if isinstance(cmd, dict):
+        if "sha256" in cmd and "files" not in cmd:
+            return None, cmd["sha256"]
+        return cmd, None
+    if isinstance(cmd, str) and len(cmd) == 64:
+        return None, cmd
+    return None, None
+
+async def reboot():
+    try:
+        await client.disconnect()
     except:
         pass
 
-async def calibrate_touch(tp, samples=20):
-    print("[Touch] Calibrating...")
-    total = 0
-    for _ in range(samples):
-        total += tp.read()
-        await asyncio.sleep_ms(50)
-    baseline = total // samples
-    threshold = int(baseline * 0.8)
-    print("[Touch] Threshold:", threshold)
-    return threshold
+    await asyncio.sleep(0.5)
+
+    # 🔴 CRITICAL: fully disable WiFi before reset
+    try:
+        wlan = network.WLAN(network.STA_IF)
+        wlan.active(False)
+        await asyncio.sleep(0.5)
+    except:
+        pass
+
+    machine.reset()
 
 # --- MQTT CALLBACK ---
 async def on_msg(topic, payload):
     global client
+    # Pulse first, so no payload can keep the LED dark
+    mqtt_state[0] = time.ticks_add(time.ticks_ms(), 5000)
     t = topic.decode()
-    p = payload.decode()
-    print(f"[MQTT] {t} -> {p}")
+    msg = codec.decode(payload)
+    print(f"[MQTT] {t} -> {msg}")
 
     if t == "tree/cmd/update":
-        print("[System] OTA reboot requested.")
-
-        try:
-            await client.disconnect()
-        except:
-            pass
-
-        await asyncio.sleep(0.5)
-
-        # 🔴 CRITICAL: fully disable WiFi before reset
-        try:
-            wlan = network.WLAN(network.STA_IF)
-            wlan.active(False)
-            await asyncio.sleep(0.5)
-        except:
-            pass
-
-        machine.reset()
-
-    mqtt_state[0] = time.ticks_add(time.ticks_ms(), 5000)
+        if ota_state["busy"]:
+            print("[OTA] Update already in progress.")
+        else:
+            print("[System] OTA requested, updating in the background.")
+            manifest, digest = parse_update_cmd(payload)
+            ota_state["busy"] = True
+            asyncio.create_task(run_ota(manifest, digest, live=True))
 
 # --- LED TASK ---
-async def pulse_led(led_pwm):
+async def pulse_led(led_pwm, gestures):
     phase = 0
     while True:
         await asyncio.sleep_ms(20)
         active = (
-            status["touch_active"] or
+            gestures.held or
             time.ticks_diff(mqtt_state[0], time.ticks_ms()) > 0
         )
         if active:
@@ -130,31 +180,74 @@ async def pulse_led(led_pwm):
             led_pwm.duty(0)
             phase = 0
 
+# --- GESTURE TASK ---
+async def publish_gestures(gestures):
+    # Each gesture goes to its own topic, rate-limited on its own
+    while True:
+        g, t, duration = await gestures.events.get()
+        name = gesture.NAMES[g]
+        route = GESTURE_ROUTES.get(name)
+        if not route or not (client and client._connected):
+            continue
+        now = time.ticks_ms()
+        if name in gesture_deadline and time.ticks_diff(now, gesture_deadline[name]) < 0:
+            continue
+        try:
+            await client.publish(route["topic"], encode_gesture(g, t, duration))
+            gesture_deadline[name] = time.ticks_add(now, route.get("rate_ms", 0))
+        except Exception as e:
+            print("[MQTT] Error:", e)
+            client._connected = False
+
+# --- OTA TASK ---
+async def run_ota(manifest=None, digest=None, live=False):
+    # live: triggered over MQTT, so the session stays up and we only reboot to activate
+    try:
+        print("[System] Checking for updates...")
+        gc.collect()
+        if await ensure_wifi():
+            try:
+                from ota import OTAUpdater
+                ota = OTAUpdater(GITHUB_URL, FILES_TO_UPDATE, CONFIG.get("ota_chunk", 1024))
+                if await ota.check_and_update(CONFIG, manifest, digest, reboot=not live):
+                    print("[OTA] Activated, rebooting.")
+                    await reboot()
+            except Exception as e:
+                print("[OTA] Skipped:", e)
+            # Drop our references too, or the collect below can't free the module
+            ota = OTAUpdater = None
+            unload(OTA_MODULES)
+        else:
+            print("[OTA] WiFi not ready, skipping OTA.")
+    finally:
+        bootprof.mark("ota")
+        ota_state["busy"] = False
+
 # --- MAIN ---
 async def example():
-    global client, publish_deadline, last_connect_time
+    global client, last_connect_time
 
     print("[System] Booting...")
-
-    # --- OTA CHECK ---
-    print("[System] Checking for updates...")
-    gc.collect()
-
-    if ensure_wifi():
-        try:
-            ota = OTAUpdater(GITHUB_URL, FILES_TO_UPDATE)
-            if ota.check_and_update(CONFIG):
-                return
-        except Exception as e:
-            print("[OTA] Skipped:", e)
-    else:
-        print("[OTA] WiFi not ready, skipping OTA.")
+    bootprof.mark("app")
 
     # --- HARDWARE ---
-    touch = TouchPad(Pin(27))
+    engine = TouchEngine(TouchPad(Pin(27)))
+    # Taps only wait for a possible second tap when double taps go somewhere
+    gestures = gesture.GestureRecognizer(double=bool(GESTURE_ROUTES.get("double_tap")))
     led_pwm = PWM(Pin(33))
     led_pwm.freq(500)
-    threshold = await calibrate_touch(touch)
+    asyncio.create_task(pulse_led(led_pwm, gestures))
+
+    # Sampling runs off a hardware timer; the baseline seeds itself from the first samples
+    engine.start()
+    asyncio.create_task(engine.run())
+    asyncio.create_task(gestures.run(engine))
+    asyncio.create_task(publish_gestures(gestures))
+    bootprof.mark("touch")
+
+    # OTA runs in the background; MQTT waits for it so only one TLS session is open
+    ota_state["busy"] = True
+    asyncio.create_task(run_ota())
 
     # --- MQTT ---
     client = MQTTWebSocketClient(
@@ -166,19 +259,24 @@ async def example():
     )
     client.set_callback(on_msg)
 
-    asyncio.create_task(pulse_led(led_pwm))
     asyncio.create_task(clear_reset_flag())
 
-    print("[System] Main loop running.")
+    gc.collect()
+    print("[System] Main loop running. Imports:", T_IMPORT, "ms, free heap:", gc.mem_free())
 
     while True:
-        if not client._connected:
+        if not client._connected and not ota_state["busy"]:
             try:
                 print("[MQTT] Connecting...")
                 await client.connect()
                 for t in TOPICS:
                     await client.subscribe(t)
                 print("[MQTT] Connected.")
+                bootprof.mark("mqtt")
+                timeline = bootprof.finish()
+                if timeline:
+                    await client.publish(BOOT_TOPIC, timeline)
+                await client.publish(STATUS_TOPIC, encode_status())
 
                 last_connect_time = time.time()
               
@@ -194,21 +292,8 @@ async def example():
             except:
                 pass
             client._connected = False
-        
-        try:
-            val = touch.read()
-            if val < threshold:
-                status["touch_active"] = True
-                if time.ticks_diff(time.ticks_ms(), publish_deadline) > 0:
-                    await client.publish(CONFIG["pub_topic"], str(val))
-                    publish_deadline = time.ticks_add(time.ticks_ms(), 5000)
-            else:
-                status["touch_active"] = False
-        except Exception as e:
-            print("[MQTT] Error:", e)
-            client._connected = False
 
-        await asyncio.sleep_ms(50)
+        await asyncio.sleep_ms(500)
 
 if __name__ == "__main__":
     try:
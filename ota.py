@@ -1,105 +1,515 @@
-import urequests
+import uasyncio as asyncio
 import os
+import sys
 import machine
 import gc
 import json
 import time
-import urandom
+import hashlib
+import ubinascii
+import struct
+from ahttp import HTTPClient
+import slots
+import state
+# deflate is built in from MicroPython 1.21; ahttp needs 1.22 anyway
+import deflate
+
+# Validators (ETag / Last-Modified) of the last manifest that was fully applied
+CACHE_KEY = "ota_cache"
+
+# Native arch index in .mpy headers / sys.implementation._mpy
+MPY_ARCHS = (None, "x86", "x64", "armv6", "armv6m", "armv7m", "armv7em",
+             "armv7emsp", "armv7emdp", "xtensa", "xtensawin", "rv32imc")
+
+# Run as scripts by the firmware, so they can never be replaced by .mpy
+NO_MPY = ("main.py", "boot.py")
+
+# Compressed artifacts must be built with this window (tools/make_manifest.py --gzip)
+WINDOW_BITS = 10
+
 
 class OTAUpdater:
-    def __init__(self, repo_url, filenames):
+    def __init__(self, repo_url, filenames, chunk_size=1024):
         self.repo_url = repo_url
         self.filenames = filenames
+        # One reusable download buffer instead of a fresh object per read
+        self.chunk_size = chunk_size
+        self._buf = None
+        # wire = bytes received, resumed = bytes kept from earlier attempts,
+        # bytes = bytes written to flash
+        self.stats = {"wire": 0, "resumed": 0, "bytes": 0, "ms": 0}
+        # Manifest and every file go over this one keep-alive connection
+        self.http = HTTPClient(repo_url)
+        # Installed slot (src) and the slot being staged (dst); "" is the root
+        self.src = ""
+        self.dst = ""
 
-    def _xor_crypt(self, data):
-        if isinstance(data, str):
-            data = data.encode()
-        key = machine.unique_id()
-        return bytes([data[i] ^ key[i % len(key)] for i in range(len(data))])
+    def _load_cache(self):
+        return state.get(CACHE_KEY) or {}
+
+    def _save_cache(self, res):
+        if res is None:
+            # Pushed manifest: no validators, the next poll compares content instead
+            return
+        cache = {}
+        if "etag" in res.headers:
+            cache["etag"] = res.headers["etag"]
+        if "last-modified" in res.headers:
+            cache["lm"] = res.headers["last-modified"]
+        try:
+            state.set(CACHE_KEY, cache)
+        except Exception as e:
+            print("[OTA] Could not save manifest cache:", e)
+
+    def _version_key(self, v):
+        # "1.10" must sort after "1.9", which float() gets wrong
+        try:
+            return tuple(int(p) for p in str(v).split("."))
+        except ValueError:
+            return (0,)
 
-    def check_and_update(self, local_config):
-        if "versions" not in local_config:
-            local_config["versions"] = {}
+    def _installed_version(self, fname, record, local_versions):
+        v = record.get(fname)
+        if v is None:
+            # Install predates slot records: hash the file itself
+            v = self._file_sha256(slots.path(self.src, fname))
+        if v is None:
+            v = local_versions.get(fname, 0)
+        return v
+
+    def _needs_update(self, fname, installed, remote, entry):
+        expected = entry.get("sha256") if entry else None
+        if not expected:
+            return self._version_key(remote.get(fname, 0)) > self._version_key(installed)
+        return installed != expected
+
+    async def _fetch_manifest(self, digest=None):
+        headers = {}
+        if digest is None:
+            cache = self._load_cache()
+            if "etag" in cache:
+                headers["If-None-Match"] = cache["etag"]
+            if "lm" in cache:
+                headers["If-Modified-Since"] = cache["lm"]
+
+        for attempt in range(3):
+            res = await self.http.get("versions.json", headers)
+            if res.status == 304:
+                return None, res
+            if res.status != 200:
+                raise Exception(f"HTTP {res.status} for versions.json")
+            body = await res.read()
+            if digest is None or ubinascii.hexlify(hashlib.sha256(body).digest()).decode() == digest.lower():
+                return json.loads(body), res
+            # raw.githubusercontent.com can serve a stale copy for a few minutes after a push
+            print("[OTA] Manifest digest mismatch, retrying...")
+            await asyncio.sleep(30)
+        raise Exception("Manifest digest mismatch")
+
+    async def check_and_update(self, config, manifest=None, digest=None, reboot=True):
+        """Checks for and stages an update, then activates it.
+
+        config: the ConfigStore; only its "versions" field is read and written.
+        manifest: an already-received manifest (e.g. pushed over MQTT), skips the fetch.
+        digest: sha256 the fetched manifest must have.
+        reboot: reset after activation; otherwise return True and let the caller reset.
+        """
+        local_versions = config.get("versions") or {}
 
         gc.collect()
-        updated = False
-        cb = urandom.getrandbits(24)
 
         try:
-            url = f"{self.repo_url}/versions.json?cb={cb}"
             print("[OTA] Checking for updates...")
+            res = None
+            remote = manifest
+            if remote is None:
+                remote, res = await self._fetch_manifest(digest)
+                if remote is None:
+                    print("[OTA] Manifest unchanged.")
+                    return False
+            # Per-file digests live under "files" so older devices still parse the manifest
+            meta = remote.get("files", {})
 
-            start = time.ticks_ms()
-            res = urequests.get(url)
-            if time.ticks_diff(time.ticks_ms(), start) > 8000:
-                raise Exception("HTTP timeout")
+            self.src = slots.active_dir()
+            record = slots.load_record(self.src)
+            current = {}
+            target = {}
+            todo = []
+            for fname in self.filenames:
+                entry = meta.get(fname)
+                current[fname] = self._installed_version(fname, record, local_versions)
+                if self._needs_update(fname, current[fname], remote, entry):
+                    todo.append(fname)
+                    target[fname] = entry["sha256"] if entry and entry.get("sha256") else remote.get(fname, 0)
+                else:
+                    print(f"[OTA] {fname} OK")
+                    target[fname] = current[fname]
 
-            remote = res.json()
-            res.close()
+            if todo and target == slots.bad_record():
+                print("[OTA] Manifest is the build that was rolled back, skipping.")
+                todo = []
 
-            for fname in self.filenames:
-                local = local_config["versions"].get(fname, 0)
-                remote_v = remote.get(fname, 0)
+            if not todo:
+                self._save_cache(res)
+                return False
+
+            if slots.load().get("pending"):
+                # The spare slot is the rollback target until the running one is stable
+                print("[OTA] Current slot not yet stable, deferring update.")
+                return False
+
+            # Stage the complete file set in the spare slot; nothing live changes until activation
+            if not self.src:
+                self.src = slots.adopt(self.filenames, current, self._buffer())
+            self.dst = slots.prepare_stage(target)
 
-                if float(remote_v) > float(local):
+            for fname in self.filenames:
+                if fname in todo:
                     print(f"[OTA] Updating {fname}")
-                    if self._download_file(fname):
-                        local_config["versions"][fname] = remote_v
-                        updated = True
+                    if not await self._download_file(fname, meta.get(fname)):
+                        print("[OTA] Update incomplete, staying on", self.src)
+                        return False
                 else:
-                    print(f"[OTA] {fname} OK")
+                    src = slots.installed(self.src, fname)
+                    if src:
+                        slots.copy(src, slots.path(self.dst, src[src.rfind("/") + 1:]), self._buffer())
 
-            if updated:
-                self._finalize_update(local_config)
-                return True
+            slots.write_record(self.dst, target)
+            for fname in todo:
+                local_versions[fname] = target[fname]
+
+            self._report()
+            return self._finalize_update(config, local_versions, res, reboot)
 
         except Exception as e:
             print("[OTA] Failed:", e)
+        finally:
+            await self.http.close()
 
         return False
 
-    def _download_file(self, filename):
+    def _staged(self, filename, meta):
+        # Left over from an interrupted attempt at the same build
+        return bool(meta and meta.get("sha256")) and \
+            self._file_sha256(slots.path(self.dst, filename)) == meta["sha256"]
+
+    async def _download_file(self, filename, meta=None):
         gc.collect()
-        try:
-            url = f"{self.repo_url}/{filename}"
-            res = urequests.get(url, stream=True)
-            if res.status_code == 200:
-                tmp = f"tmp_{filename}"
-                with open(tmp, "wb") as f:
-                    while True:
-                        chunk = res.raw.read(128)
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                res.close()
-                try:
-                    os.remove(filename)
-                except:
-                    pass
-                os.rename(tmp, filename)
+        mpy = self._pick_mpy(filename, meta)
+        if mpy:
+            mpy_name = filename[:-3] + ".mpy"
+            if self._staged(mpy_name, mpy):
+                return True
+            print(f"[OTA] Installing precompiled {mpy_name}")
+            if await self._download_full(mpy_name, mpy, mpy["path"]):
                 return True
+            print(f"[OTA] {mpy_name} failed, using {filename}")
+
+        if self._staged(filename, meta):
+            return True
+        patch = self._find_patch(filename, meta)
+        if patch:
+            print(f"[OTA] Applying delta for {filename}")
+            if await self._apply_patch(filename, patch, meta):
+                return True
+            print(f"[OTA] Delta failed, downloading full {filename}")
+        return await self._download_full(filename, meta)
+
+    def _mpy_target(self):
+        """(version, sub-version, arch) of the .mpy files this firmware loads."""
+        mpy = getattr(sys.implementation, "_mpy", None)
+        if mpy is None:
+            return None, None, None
+        arch = mpy >> 10
+        return mpy & 0xFF, (mpy >> 8) & 3, MPY_ARCHS[arch] if arch < len(MPY_ARCHS) else None
+
+    def _pick_mpy(self, filename, meta):
+        if not meta or "mpy" not in meta or filename in NO_MPY:
+            return None
+        version, sub, arch = self._mpy_target()
+        if version is None:
+            return None
+        for art in meta["mpy"]:
+            if art.get("version") != version:
+                continue
+            # Bytecode-only files carry no arch and load on any port
+            if art.get("arch") is None:
+                return art
+            # Native code also has to match the sub-version, or the import fails
+            if art["arch"] == arch and art.get("sub") == sub:
+                return art
+        print(f"[OTA] No .mpy for v{version}.{sub}/{arch}, using source")
+        return None
+
+    def _buffer(self):
+        if self._buf is None:
+            self._buf = bytearray(self.chunk_size)
+        return self._buf
+
+    async def _open(self, path, headers=None):
+        res = await self.http.get(path, headers)
+        if res.status not in (200, 206):
+            raise Exception(f"HTTP {res.status} for {path}")
+        return res
+
+    def _decompressor(self, stream, fmt):
+        if fmt == "gzip":
+            f = deflate.GZIP
+        elif fmt == "zlib":
+            f = deflate.ZLIB
+        else:
+            f = deflate.RAW
+        return deflate.DeflateIO(stream, f, WINDOW_BITS)
+
+    def _count(self, wire, size, start, resumed=0):
+        self.stats["wire"] += wire
+        self.stats["resumed"] += resumed
+        self.stats["bytes"] += size
+        self.stats["ms"] += time.ticks_diff(time.ticks_ms(), start)
+
+    async def _download_full(self, filename, meta, path=None):
+        tmp = slots.path(self.dst, f"tmp_{filename}")
+        comp = meta.get("compressed") if meta else None
+        src = comp["path"] if comp else (path or filename)
+        # The inflater needs a blocking stream, so compressed artifacts are spooled
+        # to flash first and inflated from there without touching the network.
+        spool = tmp + ".z" if comp else tmp
+        # A partial spool survives a dropped connection and is resumed with Range
+        part = spool + ".part"
+        ident = {"src": src, "sha256": meta.get("sha256") if meta else None}
+        try:
+            start = time.ticks_ms()
+            buf = self._buffer()
+            mv = memoryview(buf)
+            h = hashlib.sha256()
+            wire = 0
+
+            offset = self._resume_offset(spool, part, ident)
+            if offset:
+                print(f"[OTA] Resuming {filename} at {offset} B")
+                res = await self.http.get(src, {"Range": f"bytes={offset}-"})
+                if res.status == 206:
+                    if not comp:
+                        self._hash_file(spool, h)
+                elif res.status in (200, 416):
+                    # Range ignored or past the end; start over
+                    offset = 0
+                    if res.status == 416:
+                        res = await self._open(src)
+                else:
+                    raise Exception(f"HTTP {res.status} for {src}")
+            else:
+                res = await self._open(src)
+
+            with open(part, "w") as f:
+                json.dump(ident, f)
+
+            with open(spool, "ab" if offset else "wb") as f:
+                while True:
+                    n = await res.readinto(mv)
+                    if not n:
+                        break
+                    f.write(mv[:n])
+                    if not comp:
+                        h.update(mv[:n])
+                    wire += n
+            self._discard(part)
+
+            size = offset + wire
+            if comp:
+                size = await self._inflate(spool, tmp, comp.get("format", "gzip"), h)
+                self._discard(spool)
+            self._count(wire, size, start, offset)
+
+            return self._install(tmp, filename, meta, h.digest(), size)
+        except Exception as e:
+            # Keep the partial spool and its .part note for the next attempt
+            print("[OTA] Download failed:", e)
+            return False
+        finally:
+            if comp:
+                self._discard(tmp)
+
+    def _resume_offset(self, spool, part, ident):
+        try:
+            with open(part) as f:
+                if json.load(f) == ident:
+                    return os.stat(spool)[6]
         except:
             pass
+        self._discard(spool)
+        self._discard(part)
+        return 0
+
+    async def _inflate(self, src, dst, fmt, h):
+        buf = self._buffer()
+        mv = memoryview(buf)
+        size = 0
+        with open(src, "rb") as fin, open(dst, "wb") as fout:
+            stream = self._decompressor(fin, fmt)
+            while True:
+                n = stream.readinto(buf)
+                if not n:
+                    break
+                fout.write(mv[:n])
+                h.update(mv[:n])
+                size += n
+                # Let the LED/touch tasks run between chunks
+                await asyncio.sleep_ms(0)
+        return size
+
+    def _install(self, tmp, filename, meta, digest, size):
+        if not self._verify(filename, meta, digest, size):
+            self._discard(tmp)
+            return False
+        dest = slots.path(self.dst, filename)
+        self._discard(dest)
+        os.rename(tmp, dest)
+        return True
+
+    def _discard(self, path):
+        try:
+            os.remove(path)
+        except:
+            pass
+
+    # -----------------
+    # Delta updates
+    # -----------------
+    def _hash_file(self, path, h):
+        buf = self._buffer()
+        mv = memoryview(buf)
+        with open(path, "rb") as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(mv[:n])
+
+    def _file_sha256(self, path):
+        h = hashlib.sha256()
+        try:
+            self._hash_file(path, h)
+        except OSError:
+            return None
+        return ubinascii.hexlify(h.digest()).decode()
+
+    def _find_patch(self, filename, meta):
+        if not meta or not meta.get("patches"):
+            return None
+        installed = self._file_sha256(slots.path(self.src, filename))
+        if installed is None:
+            return None
+        return meta["patches"].get(installed)
+
+    async def _read_exact(self, res, mv, n):
+        got = 0
+        while got < n:
+            r = await res.readinto(mv[got:n])
+            if not r:
+                raise Exception("Truncated patch")
+            got += r
+        return n
+
+    async def _apply_patch(self, filename, patch, meta):
+        # Patch stream: b"DP1" then ops until b"E":
+        #   b"C" + >II offset, length   copy a range of the installed file
+        #   b"I" + >I length + data     insert literal bytes
+        tmp = slots.path(self.dst, f"tmp_{filename}")
+        try:
+            start = time.ticks_ms()
+            res = await self._open(patch["path"])
+            wire = 0
+            buf = self._buffer()
+            mv = memoryview(buf)
+            hdr = bytearray(9)
+            hmv = memoryview(hdr)
+            h = hashlib.sha256()
+            size = 0
+
+            wire += await self._read_exact(res, hmv, 3)
+            if hdr[:3] != b"DP1":
+                raise Exception("Bad patch header")
+
+            with open(slots.path(self.src, filename), "rb") as old, open(tmp, "wb") as out:
+                while True:
+                    wire += await self._read_exact(res, hmv, 1)
+                    op = hdr[0]
+                    if op == 0x45:  # E
+                        break
+                    if op == 0x43:  # C
+                        wire += await self._read_exact(res, hmv, 8)
+                        offset, length = struct.unpack_from(">II", hdr, 0)
+                        old.seek(offset)
+                        copy = True
+                    elif op == 0x49:  # I
+                        wire += await self._read_exact(res, hmv, 4)
+                        length = struct.unpack_from(">I", hdr, 0)[0]
+                        copy = False
+                    else:
+                        raise Exception("Bad patch op")
+
+                    while length:
+                        n = min(length, len(buf))
+                        if copy:
+                            if old.readinto(mv[:n]) != n:
+                                raise Exception("Copy past end of installed file")
+                        else:
+                            wire += await self._read_exact(res, mv, n)
+                        out.write(mv[:n])
+                        h.update(mv[:n])
+                        size += n
+                        length -= n
+            self._count(wire, size, start)
+
+            return self._install(tmp, filename, meta, h.digest(), size)
+        except Exception as e:
+            print("[OTA] Patch error:", e)
+        self._discard(tmp)
         return False
 
-    def _finalize_update(self, config):
+    def _report(self):
+        st = self.stats
+        # Resumed bytes came over the wire on an earlier attempt, so they aren't savings
+        saved = st["bytes"] - st["wire"] - st["resumed"]
+        pct = (saved * 100 // st["bytes"]) if st["bytes"] else 0
+        resumed = f", {st['resumed']} B resumed" if st["resumed"] else ""
+        print(f"[OTA] {st['wire']} B on the wire{resumed} for {st['bytes']} B written "
+              f"({pct}% saved) in {st['ms']} ms")
+
+    def _verify(self, filename, meta, digest, size):
+        if not meta:
+            print(f"[OTA] No digest for {filename}, skipping verification")
+            return size > 0
+
+        expected_size = meta.get("size")
+        if expected_size is not None and size != expected_size:
+            print(f"[OTA] {filename} size mismatch: {size} != {expected_size}")
+            return False
+
+        expected = meta.get("sha256")
+        if expected and ubinascii.hexlify(digest).decode() != expected.lower():
+            print(f"[OTA] {filename} sha256 mismatch")
+            return False
+        return True
+
+    def _finalize_update(self, config, versions, res=None, reboot=True):
         try:
-            print("[OTA] Saving config...")
-            enc = self._xor_crypt(json.dumps(config))
-            with open("config.dat.tmp", "wb") as f:
-                f.write(enc)
-            try:
-                os.remove("config.dat")
-            except:
-                pass
-            os.rename("config.dat.tmp", "config.dat")
-
-            with open(".ota_running", "w") as f:
-                f.write("1")
+            print("[OTA] Saving versions...")
+            config.set("versions", versions)
+            slots.activate(self.dst)
+
+            state.set("ota_running", True)
+            # Only remember the manifest once it is active, otherwise
+            # a 304 next boot would hide a failed activation
+            self._save_cache(res)
 
+            if not reboot:
+                return True
             print("[OTA] Rebooting...")
             time.sleep(1)
             machine.reset()
 
         except Exception as e:
             print("[OTA] Finalize failed:", e)
+        return False
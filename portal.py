@@ -0,0 +1,378 @@
+# portal.py
+# Captive portal for WifiManager: HTTP server and setup pages, plus the DNS
+# responder from captive_dns.py, all in one uasyncio loop.
+# Split out of wifimanager.py so a boot with working stored credentials never
+# loads this module; WifiManager imports it only when it has to fall back to
+# the portal. The pages themselves are gzipped files under static/; without
+# them, or to a client that doesn't accept gzip, a plain inline form is
+# served, so Wi-Fi can still be set up.
+
+import machine
+import os
+import json
+import uasyncio as asyncio
+from captive_dns import CaptiveDNS
+from scan_cache import ScanCache
+from httpreq import RequestParser, HTTPError, url_encode
+
+
+# -----------------
+# Web server (captive portal)
+# -----------------
+# Phones in captive-portal mode open several connections at once (probe URLs,
+# the page, favicon), so every client gets its own task and connections are
+# kept alive between requests.
+PORT = 80
+BACKLOG = 8
+# Time allowed for one request's line and headers once it has started
+REQUEST_TIMEOUT = 5
+# How long an idle keep-alive connection is held open
+IDLE_TIMEOUT = 15
+MAX_REQUESTS = 20
+
+REASONS = {200: 'OK', 302: 'Found', 303: 'See Other', 304: 'Not Modified', 400: 'Bad Request',
+           404: 'Not Found', 406: 'Not Acceptable', 413: 'Payload Too Large', 414: 'URI Too Long',
+           431: 'Request Header Fields Too Large', 500: 'Internal Server Error'}
+
+STATIC_DIR = 'static'
+CHUNK = 512
+
+# Set up by serve(); pages read networks from here instead of scanning
+scan_cache = None
+_asset_index = None
+_buf = bytearray(CHUNK)
+
+
+def web_server(wm):
+    asyncio.run(serve(wm))
+
+
+async def serve(wm):
+    global scan_cache
+    try:
+        wm.wlan_ap.active(True)
+        wm.wlan_ap.config(essid=wm.ap_ssid, password=wm.ap_password, authmode=wm.ap_authmode)
+        wm.wlan_ap.ifconfig((wm.ap_ip, wm.ap_netmask, wm.ap_gateway, wm.ap_dns))
+        await asyncio.sleep_ms(200)
+        wm.wlan_ap.active(True)
+    except Exception as e:
+        if wm.debug:
+            print("[wm] ap.active(True) failed:", e)
+
+    try:
+        server = await asyncio.start_server(lambda r, w: _serve_client(wm, r, w), '0.0.0.0', PORT, backlog=BACKLOG)
+    except Exception as e:
+        if wm.debug:
+            print("[wm] server socket setup failed:", e)
+        return
+
+    dns = asyncio.create_task(CaptiveDNS(wm.ap_ip, wm.debug).serve())
+    scan_cache = ScanCache(wm.wlan_sta, wm.scans, wm.debug)
+    scanner = asyncio.create_task(scan_cache.run())
+    print('Connect to', wm.ap_ssid, 'and open the captive portal at', wm.ap_ip)
+
+    test = None
+    while True:
+        await asyncio.sleep_ms(250)
+        if wm.new_credentials_to_try and not test:
+            ssid, password = wm.new_credentials_to_try
+            wm.new_credentials_to_try = None
+            test = asyncio.create_task(_try_credentials(wm, ssid, password))
+        if test and test.done():
+            test = None
+        if not test and wm.wlan_sta.isconnected():
+            try:
+                wm.wlan_ap.active(False)
+            except:
+                pass
+            if wm.reboot:
+                print('The device will reboot in 5 seconds.')
+                await asyncio.sleep(5)
+                machine.reset()
+            break # Exit portal loop
+
+    dns.cancel()
+    scanner.cancel()
+    server.close()
+    await server.wait_closed()
+
+
+async def _try_credentials(wm, ssid, password):
+    # Same as WifiManager.wifi_connect, but polls without blocking the server
+    print('Trying to connect to:', ssid)
+    try:
+        wm.wlan_sta.connect(ssid, password)
+    except Exception as e:
+        if wm.debug:
+            print("[wm] wlan_sta.connect error:", e)
+    for _ in range(100):
+        if wm.wlan_sta.isconnected():
+            print(f"Successfully connected to {ssid}. Saving credentials.")
+            profiles = wm.read_credentials()
+            profiles[ssid] = password
+            wm.write_credentials(profiles)
+            return True
+        await asyncio.sleep_ms(100)
+    print(f"Connection to {ssid} failed. Keeping AP up for re-configuration.")
+    try:
+        wm.wlan_sta.disconnect()
+    except:
+        pass
+    return False
+
+
+async def _serve_client(wm, reader, writer):
+    parser = RequestParser(reader, REQUEST_TIMEOUT)
+    try:
+        for i in range(MAX_REQUESTS):
+            try:
+                req = await parser.next(REQUEST_TIMEOUT if i == 0 else IDLE_TIMEOUT)
+            except HTTPError as e:
+                await _send_response(writer, "<p>Bad request</p>", status_code=e.status)
+                break
+            if req is None:
+                break
+            if wm.debug:
+                print("[wm] REQ:", req.method, req.host, req.path)
+            keep = req.keep_alive() and i < MAX_REQUESTS - 1
+            await _dispatch(wm, req, writer, keep)
+            if not keep:
+                break
+    except Exception as error:
+        # Timeouts, resets and malformed requests all just end the connection
+        if wm.debug:
+            print("[wm] client closed:", error)
+    finally:
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except:
+            pass
+
+
+async def _dispatch(wm, req, writer, keep):
+    host = req.host.split(':')[0]
+    if host and host != wm.ap_ip:
+        # Any other hostname is an OS connectivity probe or a page the user
+        # tried to open: send it to the portal so the sign-in sheet pops up
+        handler = _handle_probe
+    else:
+        handler = ROUTES.get(req.path) or _handle_asset
+    await handler(wm, req, writer, keep)
+
+
+# -----------------
+# HTTP helpers
+# -----------------
+async def _send_header(writer, status_code=200, content_type='text/html', content_length=None, keep=False, extra=''):
+    head = "HTTP/1.1 {0} {1}\r\nContent-Type: {2}\r\n".format(status_code, REASONS.get(status_code, 'OK'), content_type)
+    if content_length is not None:
+        head += "Content-Length: {}\r\n".format(content_length)
+    head += extra
+    head += "Connection: {}\r\n\r\n".format('keep-alive' if keep else 'close')
+    writer.write(head.encode())
+    await writer.drain()
+
+
+async def _send_response(writer, payload, status_code=200, keep=False):
+    if isinstance(payload, str):
+        body = payload
+    else:
+        body = str(payload)
+    body_bytes = body.encode('utf-8')
+    await _send_header(writer, status_code=status_code, content_length=len(body_bytes), keep=keep)
+    writer.write(body_bytes)
+    await writer.drain()
+
+
+async def _send_redirect(writer, location, keep=False):
+    await _send_header(writer, 302, content_length=0, keep=keep, extra="Location: {}\r\n".format(location))
+
+
+# -----------------
+# Static assets (built from www/ by tools/build_www.py)
+# -----------------
+def _gzip_ok(headers):
+    # Assets are stored gzipped only; a client that doesn't say it takes gzip
+    # (including one sending no Accept-Encoding) gets the fallback pages
+    return 'gzip' in headers.get('accept-encoding', '')
+
+
+def _static(name):
+    """(meta, path, size) of a built asset, or None if it isn't on the device."""
+    meta = _assets().get(name)
+    if not meta:
+        return None
+    path = STATIC_DIR + '/' + name + '.gz'
+    try:
+        return meta, path, os.stat(path)[6]
+    except OSError:
+        return None
+
+
+async def _send_static(writer, name, headers, keep):
+    found = _static(name)
+    if not found:
+        await _send_response(writer, "<p>Portal files missing: upload static/</p>", status_code=404, keep=keep)
+        return
+    meta, path, size = found
+    etag = '"{}"'.format(meta['etag'])
+    cache = "Cache-Control: {}\r\nETag: {}\r\n".format(
+        'no-cache' if name.endswith('.html') else 'max-age=86400', etag)
+    if headers.get('if-none-match', '') == etag:
+        await _send_header(writer, 304, meta['type'], 0, keep, cache)
+        return
+    await _send_header(writer, 200, meta['type'], size, keep,
+                       cache + "Content-Encoding: gzip\r\nVary: Accept-Encoding\r\n")
+    # One shared buffer is enough: each readinto() is written out before the next await
+    mv = memoryview(_buf)
+    with open(path, 'rb') as f:
+        while True:
+            n = f.readinto(_buf)
+            if not n:
+                break
+            writer.write(mv[:n])
+            await writer.drain()
+
+
+def _assets():
+    global _asset_index
+    if _asset_index is None:
+        try:
+            with open(STATIC_DIR + '/assets.json') as f:
+                _asset_index = json.load(f)
+        except Exception:
+            _asset_index = {}
+    return _asset_index
+
+
+async def _send_networks(writer, keep):
+    # Chunked, one network per chunk, so the response never exists in RAM as a whole
+    await _send_header(writer, 200, 'application/json', None, keep,
+                       "Cache-Control: no-store\r\nTransfer-Encoding: chunked\r\n")
+    age = scan_cache.age_s()
+    await _send_chunk(writer, '{{"age": {}, "networks": ['.format('null' if age is None else age))
+    for i, (ssid, rssi, channel, authmode) in enumerate(scan_cache.networks):
+        await _send_chunk(writer, '{}{{"ssid": {}, "rssi": {}, "ch": {}, "auth": {}}}'.format(
+            ', ' if i else '', json.dumps(ssid), rssi, channel, authmode))
+    await _send_chunk(writer, ']}')
+    writer.write(b'0\r\n\r\n')
+    await writer.drain()
+
+
+async def _send_chunk(writer, text):
+    data = text.encode('utf-8')
+    writer.write(('%x\r\n' % len(data)).encode())
+    writer.write(data)
+    writer.write(b'\r\n')
+    await writer.drain()
+
+
+# -----------------
+# Fallback pages, for a device without static/
+# -----------------
+# {} takes extra <head> tags
+FALLBACK_HEAD = ('<!DOCTYPE html><html><head><meta name="viewport" content="width=device-width, initial-scale=1">'
+                 '{}<title>ESP32 Wi-Fi Setup</title></head><body>')
+
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+async def _send_fallback_form(writer, keep):
+    # Server-rendered from the scan cache, no script or stylesheet needed
+    await _send_header(writer, 200, 'text/html; charset=utf-8', None, keep,
+                       "Cache-Control: no-store\r\nTransfer-Encoding: chunked\r\n")
+    await _send_chunk(writer, FALLBACK_HEAD.format('') + '<h1>Wi-Fi Setup</h1><form action="/configure" method="post">')
+    for i, (ssid, rssi, channel, authmode) in enumerate(scan_cache.networks):
+        await _send_chunk(writer, '<p><label><input type="radio" name="ssid" value="{0}"{1}> {0} ({2} dBm)</label></p>'
+                          .format(_escape(ssid), '' if i else ' checked', rssi))
+    if not scan_cache.networks:
+        await _send_chunk(writer, '<p>No networks found yet.</p>')
+    await _send_chunk(writer, '<p><input type="password" name="password" placeholder="Password"></p>'
+                              '<p><input type="submit" value="Connect"> <a href="/">Refresh</a></p></form></body></html>')
+    writer.write(b'0\r\n\r\n')
+    await writer.drain()
+
+
+async def _send_fallback_connecting(writer, ssid, keep):
+    await _send_response(writer, FALLBACK_HEAD.format('<meta http-equiv="refresh" content="7; url=/">') +
+                         '<h1>Attempting to Connect</h1><p>Trying to connect to network: <strong>{}</strong></p>'
+                         '<p>If connection fails, this page will reload.</p></body></html>'.format(_escape(ssid)),
+                         keep=keep)
+
+
+# -----------------
+# Portal pages
+# -----------------
+async def _handle_root(wm, req, writer, keep):
+    if _static('index.html') and _gzip_ok(req.headers):
+        await _send_static(writer, 'index.html', req.headers, keep)
+    else:
+        await _send_fallback_form(writer, keep)
+
+
+async def _handle_asset(wm, req, writer, keep):
+    name = req.path.lstrip('/')
+    if name in _assets():
+        if _gzip_ok(req.headers):
+            await _send_static(writer, name, req.headers, keep)
+        else:
+            await _send_response(writer, "<p>Only available gzip-encoded</p>", status_code=406, keep=keep)
+    else:
+        await _handle_not_found(wm, req, writer, keep)
+
+
+async def _handle_probe(wm, req, writer, keep):
+    await _send_redirect(writer, "http://{}/".format(wm.ap_ip), keep)
+
+
+async def _handle_networks(wm, req, writer, keep):
+    await _send_networks(writer, keep)
+
+
+async def _handle_rescan(wm, req, writer, keep):
+    await scan_cache.rescan()
+    await _send_networks(writer, keep)
+
+
+async def _handle_configure(wm, req, writer, keep):
+    params = req.params()
+    ssid = params.get('ssid', '')
+    password = params.get('password', '')
+    if 'ssid' not in params:
+        await _send_response(writer, "<p>Parameters not found!</p>", status_code=400, keep=keep)
+        return
+    if len(ssid) == 0:
+        await _send_response(writer, "<p>SSID must be provided!</p>", status_code=400, keep=keep)
+        return
+
+    wm.new_credentials_to_try = (ssid, password)
+    if not (_static('connecting.html') and _gzip_ok(req.headers)):
+        await _send_fallback_connecting(writer, ssid, keep)
+    elif req.method == 'POST':
+        # Post/redirect/get: keeps the password out of the URL and history
+        await _send_header(writer, 303, content_length=0, keep=keep,
+                           extra="Location: /connecting.html?ssid={}\r\n".format(url_encode(ssid)))
+    else:
+        # The page reads the SSID from its own query string
+        await _send_static(writer, 'connecting.html', req.headers, keep)
+
+
+async def _handle_not_found(wm, req, writer, keep):
+    await _send_response(writer, "<p>Page not found!</p>", status_code=404, keep=keep)
+
+
+ROUTES = {
+    '/': _handle_root,
+    '/configure': _handle_configure,
+    '/networks.json': _handle_networks,
+    '/rescan': _handle_rescan,
+    # Probe paths some OSes request by IP rather than by hostname
+    '/generate_204': _handle_probe,
+    '/gen_204': _handle_probe,
+    '/hotspot-detect.html': _handle_probe,
+    '/connecttest.txt': _handle_probe,
+    '/ncsi.txt': _handle_probe,
+}
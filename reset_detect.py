@@ -0,0 +1,63 @@
+# reset_detect.py
+# Double-reset detector. The "armed" mark lives in RTC memory, which survives
+# resets but not power loss, so a normal boot costs no flash writes. Boards
+# without RTC memory fall back to the reset_flag key in the state journal.
+#
+# RTC memory layout: b"DR" + armed (1) + checksum (1). Garbage left after a
+# power-on fails the magic/checksum and reads as not armed.
+
+import machine
+import state
+
+MAGIC = b"DR"
+
+try:
+    _rtc = machine.RTC()
+    _rtc.memory()
+except Exception:
+    _rtc = None
+
+
+def _checksum(data):
+    return sum(data) & 0xFF
+
+
+def _read():
+    m = _rtc.memory()
+    if len(m) < 4 or m[:2] != MAGIC or m[3] != _checksum(m[:3]):
+        return False
+    return m[2] == 1
+
+
+def _write(armed):
+    b = MAGIC + bytes([1 if armed else 0])
+    _rtc.memory(b + bytes([_checksum(b)]))
+
+
+def triggered():
+    """True if the previous boot armed the detector and never reached clear()."""
+    if _rtc:
+        return _read()
+    return bool(state.get("reset_flag"))
+
+
+def arm():
+    if _rtc:
+        _write(True)
+    else:
+        state.set("reset_flag", True)
+
+
+def clear():
+    """Disarms the detector. Returns True if it was armed."""
+    if _rtc:
+        # A flag imported from the old .reset_flag file is never read again
+        state.delete("reset_flag")
+        if not _read():
+            return False
+        _write(False)
+        return True
+    if state.get("reset_flag"):
+        state.delete("reset_flag")
+        return True
+    return False
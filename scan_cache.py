@@ -0,0 +1,88 @@
+# scan_cache.py
+# Wi-Fi scan results for the captive portal, refreshed by a background task so
+# page requests never wait on wlan.scan() (which takes seconds on the ESP32).
+
+import time
+import uasyncio as asyncio
+
+# Background rescan period while the portal is up
+INTERVAL_S = 30
+# Rescan requests closer together than this reuse the last result
+MIN_GAP_S = 5
+
+
+class ScanCache:
+    def __init__(self, wlan, scans=None, debug=False):
+        self.wlan = wlan
+        self.debug = debug
+        # [(ssid, rssi, channel, authmode)], strongest first
+        self.networks = []
+        self.stamp = None
+        self.scanning = False
+        self._wake = asyncio.Event()
+        self._done = asyncio.Event()
+        if scans:
+            # Seed with the scan WifiManager.connect() just made
+            self._store(scans)
+
+    def _store(self, scans):
+        best = {}
+        for ssid, bssid, channel, rssi, authmode, *_ in scans:
+            try:
+                ssid = ssid.decode("utf-8")
+            except Exception:
+                continue
+            if not ssid:
+                # Hidden network
+                continue
+            if ssid not in best or rssi > best[ssid][1]:
+                best[ssid] = (ssid, rssi, channel, authmode)
+        self.networks = sorted(best.values(), key=lambda n: n[1], reverse=True)
+        self.stamp = time.ticks_ms()
+
+    def age_s(self):
+        """Seconds since the last completed scan, or None before the first one."""
+        if self.stamp is None:
+            return None
+        return time.ticks_diff(time.ticks_ms(), self.stamp) // 1000
+
+    def scan(self):
+        self.scanning = True
+        try:
+            self._store(self.wlan.scan())
+            if self.debug:
+                print("[scan]", len(self.networks), "networks")
+        except Exception as e:
+            if self.debug:
+                print("[scan] failed:", e)
+        finally:
+            self.scanning = False
+
+    async def rescan(self):
+        """Asks the background task for a fresh scan and waits for it."""
+        age = self.age_s()
+        if age is not None and age < MIN_GAP_S:
+            return
+        self._done.clear()
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._done.wait(), 15)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        force = False
+        while True:
+            age = self.age_s()
+            if force or age is None or age >= INTERVAL_S:
+                # Give the HTTP tasks a turn before the blocking scan
+                await asyncio.sleep_ms(0)
+                self.scan()
+                self._done.set()
+            force = False
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(1, INTERVAL_S - (self.age_s() or 0)))
+                self._wake.clear()
+                force = True
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,192 @@
+# slots.py
+# A/B install slots for OTA: stage a full file set, switch with one rename, roll back on bad boots
+
+import os
+import sys
+import json
+import state
+
+SLOTS = ("slot_a", "slot_b")
+STATE_KEY = "slots"
+# Per-slot record of what was installed: {filename: sha256 or version}
+RECORD = ".record"
+# Build a half-filled stage belongs to, so an interrupted update can resume into it
+TARGET = ".target"
+# Boots a new slot gets to reach the stable point before it is rolled back
+MAX_TRIAL_BOOTS = 3
+
+_state = None
+
+
+def load():
+    global _state
+    if _state is None:
+        _state = state.get(STATE_KEY) or {}
+    return _state
+
+
+def _save(st):
+    # One journal record is the atomic switch; a torn append is dropped on replay
+    state.set(STATE_KEY, st)
+
+
+def active_dir():
+    return load().get("active", "")
+
+
+def path(slot, fname):
+    return slot + "/" + fname if slot else fname
+
+
+def _exists(p):
+    try:
+        os.stat(p)
+        return True
+    except OSError:
+        return False
+
+
+def installed(slot, fname):
+    """Path of the installed form of fname in slot (.py or .mpy), or None."""
+    p = path(slot, fname)
+    if _exists(p):
+        return p
+    if fname.endswith(".py"):
+        p = p[:-3] + ".mpy"
+        if _exists(p):
+            return p
+    return None
+
+
+def _clear(slot):
+    try:
+        names = os.listdir(slot)
+    except OSError:
+        os.mkdir(slot)
+        return
+    for name in names:
+        os.remove(path(slot, name))
+
+
+def copy(src, dst, buf):
+    mv = memoryview(buf)
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while True:
+            n = fin.readinto(buf)
+            if not n:
+                break
+            fout.write(mv[:n])
+
+
+def load_record(slot):
+    try:
+        with open(path(slot, RECORD)) as f:
+            return json.load(f)
+    except:
+        return {}
+
+
+def write_record(slot, record):
+    with open(path(slot, RECORD), "w") as f:
+        json.dump(record, f)
+
+
+def adopt(filenames, record, buf):
+    """Moves a pre-slot install (files in the root) into the first slot."""
+    slot = SLOTS[0]
+    _clear(slot)
+    for fname in filenames:
+        src = installed("", fname)
+        if src:
+            copy(src, path(slot, src), buf)
+    write_record(slot, record)
+    st = load()
+    st.update({"active": slot, "prev": "", "pending": False, "boots": 0, "main_synced": True})
+    _save(st)
+    return slot
+
+
+def prepare_stage(target):
+    active = active_dir()
+    stage = SLOTS[1] if active == SLOTS[0] else SLOTS[0]
+    try:
+        with open(path(stage, TARGET)) as f:
+            if json.load(f) == target:
+                return stage
+    except:
+        pass
+    _clear(stage)
+    with open(path(stage, TARGET), "w") as f:
+        json.dump(target, f)
+    return stage
+
+
+def activate(stage):
+    try:
+        os.remove(path(stage, TARGET))
+    except:
+        pass
+    st = load()
+    st.update({
+        "prev": st.get("active", ""),
+        "active": stage,
+        "pending": True,
+        "boots": 0,
+        "main_synced": False,
+    })
+    _save(st)
+    _sync_main(st)
+
+
+def _sync_main(st):
+    # main.py is run from the root by the firmware, so the active slot's copy is mirrored there
+    src = path(st.get("active", ""), "main.py")
+    if st.get("active") and _exists(src):
+        copy(src, "main.py.tmp", bytearray(512))
+        try:
+            os.remove("main.py")
+        except:
+            pass
+        os.rename("main.py.tmp", "main.py")
+    st["main_synced"] = True
+    _save(st)
+
+
+def rollback(st):
+    print("[Slots] Rolling back", st.get("active"), "->", st.get("prev"))
+    # Remember the failed build so the updater doesn't reinstall it straight away
+    st["bad"] = load_record(st.get("active", ""))
+    st.update({"active": st.get("prev", ""), "prev": "", "pending": False, "boots": 0, "main_synced": False})
+    _save(st)
+    state.delete("ota_cache")
+    _sync_main(st)
+
+
+def boot_check():
+    """Called from boot: counts trial boots, rolls back if needed, and activates the slot on sys.path."""
+    st = load()
+    if st.get("pending"):
+        st["boots"] = st.get("boots", 0) + 1
+        if st["boots"] > MAX_TRIAL_BOOTS:
+            rollback(st)
+        else:
+            print("[Slots] Trial boot", st["boots"], "of", st.get("active"))
+            _save(st)
+    if not st.get("main_synced", True):
+        _sync_main(st)
+    active = st.get("active")
+    if active and active not in sys.path:
+        sys.path.insert(0, active)
+
+
+def mark_stable():
+    st = load()
+    if st.get("pending"):
+        st["pending"] = False
+        st["boots"] = 0
+        _save(st)
+        print("[Slots] Slot", st.get("active"), "marked stable.")
+
+
+def bad_record():
+    return load().get("bad", {})
@@ -0,0 +1,168 @@
+# state.py
+# Tiny append-only journaled key/value store for boot and OTA state.
+#
+# Replaces the marker files (.reset_flag, .ota_running, ...) and repeated
+# os.listdir() scans: the journal is replayed once into RAM, reads are dict
+# lookups and every change is a single append.
+#
+# Record: 0xA5, key length (1), value length (2), key, JSON value, checksum (1)
+# A value length of 0xFFFF is a delete. A torn record at the end (power loss
+# mid-append) fails its checksum and is dropped by the next compaction.
+
+import os
+import json
+import struct
+import fsutil
+
+LOG_FILE = "state.log"
+MARK = 0xA5
+DELETED = 0xFFFF
+# Rewrite the journal with only live keys once it grows past this
+MAX_LOG = 2048
+
+_index = None
+_size = 0
+
+
+def _checksum(data):
+    s = 0
+    for b in data:
+        s += b
+    return s & 0xFF
+
+
+def _record(key, raw):
+    kb = key.encode()
+    body = struct.pack(">BBH", MARK, len(kb), DELETED if raw is None else len(raw)) + kb + (raw or b"")
+    return body + bytes([_checksum(body)])
+
+
+def _parse(data, index):
+    """Applies the records in data to index. Returns the length of the valid prefix."""
+    pos = 0
+    while pos + 4 <= len(data):
+        mark, klen, vlen = struct.unpack_from(">BBH", data, pos)
+        vsize = 0 if vlen == DELETED else vlen
+        end = pos + 4 + klen + vsize
+        if mark != MARK or end >= len(data) or data[end] != _checksum(data[pos:end]):
+            break
+        key = data[pos + 4:pos + 4 + klen].decode()
+        if vlen == DELETED:
+            index.pop(key, None)
+        else:
+            index[key] = data[pos + 4 + klen:end]
+        pos = end + 1
+    return pos
+
+
+def _complete(tmp):
+    # A torn tmp, e.g. from the first compaction during _migrate(), fails to parse
+    with open(tmp, "rb") as f:
+        data = f.read()
+    return data and _parse(data, {}) == len(data)
+
+
+def _replay():
+    global _index, _size
+    _index = {}
+    _size = 0
+    try:
+        with open(LOG_FILE, "rb") as f:
+            data = f.read()
+    except OSError:
+        if not fsutil.recover(LOG_FILE, _complete, "[State]"):
+            _migrate()
+            return
+        with open(LOG_FILE, "rb") as f:
+            data = f.read()
+    _size = _parse(data, _index)
+    if _size != len(data):
+        compact()
+
+
+def _migrate():
+    # One-time import of the marker files and JSON state this journal replaces
+    try:
+        names = os.listdir()
+    except OSError:
+        return
+    if ".reset_flag" in names:
+        _index["reset_flag"] = b"true"
+    if ".ota_running" in names:
+        _index["ota_running"] = b"true"
+    _index["has_wifi"] = b"true" if "wifi.dat" in names else b"false"
+    for name, key in (("slot.json", "slots"), ("ota_cache.json", "ota_cache")):
+        if name in names:
+            try:
+                with open(name, "rb") as f:
+                    _index[key] = f.read()
+            except OSError:
+                pass
+    compact()
+    for name in (".reset_flag", ".ota_running", "slot.json", "ota_cache.json"):
+        if name in names:
+            os.remove(name)
+
+
+def _idx():
+    if _index is None:
+        _replay()
+    return _index
+
+
+def get(key, default=None):
+    raw = _idx().get(key)
+    if raw is None:
+        return default
+    return json.loads(raw)
+
+
+def has(key):
+    return key in _idx()
+
+
+def set(key, value):
+    """Appends key=value, unless it already holds exactly that value."""
+    global _size
+    raw = json.dumps(value).encode()
+    idx = _idx()
+    if idx.get(key) == raw:
+        return
+    rec = _record(key, raw)
+    if _size + len(rec) > MAX_LOG:
+        idx[key] = raw
+        compact()
+        return
+    with open(LOG_FILE, "ab") as f:
+        f.write(rec)
+    idx[key] = raw
+    _size += len(rec)
+    fsutil.count()
+
+
+def delete(key):
+    global _size
+    idx = _idx()
+    if key not in idx:
+        return
+    del idx[key]
+    rec = _record(key, None)
+    with open(LOG_FILE, "ab") as f:
+        f.write(rec)
+    _size += len(rec)
+    fsutil.count()
+
+
+def compact():
+    """Rewrites the journal with one record per live key (tmp + rename)."""
+    global _size
+    idx = _idx()
+    size = 0
+    with open(LOG_FILE + ".tmp", "wb") as f:
+        for key, raw in idx.items():
+            rec = _record(key, raw)
+            f.write(rec)
+            size += len(rec)
+    fsutil.count()
+    fsutil.replace(LOG_FILE + ".tmp", LOG_FILE)
+    _size = size
@@ -0,0 +1,267 @@
+# boot_bench.py
+# Host-side (CPython) before/after measurement of the boot state path: the
+# marker files and os.listdir() checks new_boot.py and new_touch.py used
+# before state.py, against the journal, reset_detect, slots, bootprof and
+# config_store as they run now. Boots a scratch filesystem a number of times,
+# re-importing the device modules on each boot as a reset would, and counts
+# what every boot does to flash: listdir scans, file opens, writes (files
+# opened for writing, renames, removes) and bytes written. It also checks that
+# fsutil.writes, the count new_boot.py prints on the board, matches the writes
+# seen here.
+#
+# Covers boot.py up to the WiFi connect and the app's config reads, the
+# stable-point reset-flag clear and the boot timeline; the WiFi connect
+# itself is left out. Times are host times: compare rows with each other,
+# not with the board.
+#
+#   python tools/boot_bench.py
+#   python tools/boot_bench.py -n 200
+
+import argparse
+import builtins
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import hostenv
+hostenv.install()
+
+# Reloaded on every boot, as after a reset. All but bootprof are imported
+# before the clock starts: loading code isn't part of the state path, and
+# bootprof's import is where the journal gets replayed.
+DEVICE_MODULES = ("fsutil", "state", "reset_detect", "slots", "config_store", "crypto", "bootprof")
+
+CONFIG = {"url": "wss://broker.example.com/mqtt", "user": "device", "pass": "x" * 24,
+          "sub_topics": ["home/tree"], "pub_topic": "touch", "versions": {}, "github_url": ""}
+
+
+class Flash:
+    """Counts filesystem calls while installed over builtins.open and os.*"""
+    def __init__(self):
+        self.reset()
+        self._open = builtins.open
+        self._os = {name: getattr(os, name) for name in ("listdir", "remove", "rename", "mkdir")}
+
+    def reset(self):
+        self.listdirs = self.opens = self.writes = self.bytes = 0
+
+    def install(self):
+        flash = self
+
+        class Writer:
+            def __init__(self, f):
+                self.f = f
+
+            def write(self, data):
+                flash.bytes += len(data)
+                return self.f.write(data)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                self.f.close()
+
+            def __getattr__(self, name):
+                return getattr(self.f, name)
+
+        def open_(path, mode="r", *args, **kw):
+            self.opens += 1
+            f = self._open(path, mode, *args, **kw)
+            if any(c in mode for c in "wa+"):
+                self.writes += 1
+                return Writer(f)
+            return f
+
+        def listdir(*args):
+            self.listdirs += 1
+            return self._os["listdir"](*args)
+
+        def changes(name):
+            def fn(*args):
+                self.writes += 1
+                return self._os[name](*args)
+            return fn
+
+        builtins.open = open_
+        os.listdir = listdir
+        for name in ("remove", "rename", "mkdir"):
+            setattr(os, name, changes(name))
+
+    def uninstall(self):
+        builtins.open = self._open
+        for name, fn in self._os.items():
+            setattr(os, name, fn)
+
+
+class RTC:
+    """machine.RTC stand-in whose memory survives the simulated resets."""
+    memory_ = b""
+
+    def memory(self, data=None):
+        if data is None:
+            return RTC.memory_
+        RTC.memory_ = bytes(data)
+
+
+# -----------------
+# Before: the boot path this work replaced
+# -----------------
+def old_boot():
+    # new_boot.py: one listdir per check, and a flag file on every normal boot
+    if ".ota_running" in os.listdir():
+        os.remove(".ota_running")
+        if ".reset_flag" in os.listdir():
+            os.remove(".reset_flag")
+    elif ".reset_flag" in os.listdir():
+        os.remove("wifi.dat")
+        os.remove(".reset_flag")
+    elif "wifi.dat" in os.listdir():
+        with open(".reset_flag", "w") as f:
+            f.write("1")
+
+
+def old_app():
+    # new_touch.py load_config() and clear_reset_flag()
+    import machine
+    key = machine.unique_id()
+    cfg = None
+    if "config.dat" in os.listdir():
+        with open("config.dat", "rb") as f:
+            raw = f.read()
+        cfg = json.loads(bytes([raw[i] ^ key[i % len(key)] for i in range(len(raw))]).decode())
+    if cfg is None and "config.json" in os.listdir():
+        with open("config.json") as f:
+            cfg = json.load(f)
+    topics = cfg.get("sub_topics", [])
+    url = cfg.get("github_url", "")
+    if ".reset_flag" in os.listdir():
+        os.remove(".reset_flag")
+    return topics, url
+
+
+def old_setup():
+    import crypto
+    with open("config.dat", "wb") as f:
+        crypto.Writer(f, crypto.MODE_XOR).write(json.dumps(CONFIG))
+
+
+# -----------------
+# After: the modules as new_boot.py and new_touch.py use them now
+# -----------------
+def new_boot():
+    import bootprof
+    import reset_detect
+    import slots
+    import state
+    bootprof.mark("boot")
+    slots.boot_check()
+    if state.get("ota_running"):
+        state.delete("ota_running")
+        reset_detect.clear()
+    elif reset_detect.triggered():
+        os.remove("wifi.dat")
+        state.set("has_wifi", False)
+        reset_detect.clear()
+    elif state.get("has_wifi"):
+        reset_detect.arm()
+    bootprof.mark("state")
+
+
+def new_app():
+    import bootprof
+    import reset_detect
+    import slots
+    from config_store import ConfigStore
+    config = ConfigStore()
+    config.migrate()
+    # The fields new_touch.py reads at import
+    fields = [config.get(k) for k in ("sub_topics", "github_url", "pub_topic", "boot_topic",
+                                      "status_topic", "payload_format", "gestures")]
+    slots.mark_stable()
+    reset_detect.clear()
+    bootprof.mark("mqtt")
+    bootprof.finish()
+    return fields
+
+
+def new_setup():
+    old_setup()
+    # First boot imports the legacy config and marker files; not measured
+    new_boot()
+    new_app()
+
+
+# -----------------
+def run(name, setup, boot, app, boots, rtc):
+    work = tempfile.mkdtemp(prefix="boot_bench_")
+    os.chdir(work)
+    machine = sys.modules["machine"]
+    real_rtc = machine.RTC
+    if rtc:
+        machine.RTC = RTC
+        RTC.memory_ = b""
+    with open("wifi.dat", "wb") as f:
+        f.write(b"x")
+
+    flash = Flash()
+    totals = {"listdirs": 0, "opens": 0, "writes": 0, "bytes": 0}
+    best = None
+    counted = 0
+    try:
+        for i in range(boots + 1):
+            for mod in DEVICE_MODULES:
+                sys.modules.pop(mod, None)
+            if i == 0:
+                setup()
+                continue
+            for mod in DEVICE_MODULES[:-1]:
+                __import__(mod)
+            flash.reset()
+            flash.install()
+            try:
+                t0 = time.perf_counter()
+                boot()
+                app()
+                secs = time.perf_counter() - t0
+            finally:
+                flash.uninstall()
+            best = secs if best is None else min(best, secs)
+            for k in totals:
+                totals[k] += getattr(flash, k)
+            fsutil = sys.modules.get("fsutil")
+            if fsutil:
+                counted += fsutil.writes
+    finally:
+        machine.RTC = real_rtc
+        os.chdir(hostenv.ROOT)
+        shutil.rmtree(work)
+
+    print("{:<22} {:>9.3f} {:>9.2f} {:>7.2f} {:>7.2f} {:>8.1f}".format(
+        name, best * 1000, totals["listdirs"] / boots, totals["opens"] / boots,
+        totals["writes"] / boots, totals["bytes"] / boots))
+    return counted, totals["writes"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--boots", type=int, default=100, help="normal boots to average over")
+    args = parser.parse_args()
+
+    print("{} normal boots with WiFi configured, per boot:".format(args.boots))
+    print("{:<22} {:>9} {:>9} {:>7} {:>7} {:>8}".format("", "best ms", "listdirs", "opens", "writes", "bytes"))
+    run("before (marker files)", old_setup, old_boot, old_app, args.boots, False)
+    failed = False
+    for name, rtc in (("after (RTC memory)", True), ("after (no RTC)", False)):
+        counted, seen = run(name, new_setup, new_boot, new_app, args.boots, rtc)
+        if counted != seen:
+            print("  fsutil.writes counted {} writes, {} seen".format(counted, seen))
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# build_www.py
+# Host-side (CPython) helper: gzips the portal UI in www/ into static/, which
+# is copied to the device as-is and streamed by portal.py with
+# Content-Encoding: gzip. Also writes static/assets.json with each file's
+# content type and ETag.
+#
+#   python tools/build_www.py
+#   mpremote fs cp -r static :
+
+import gzip
+import hashlib
+import json
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "www")
+OUT = os.path.join(ROOT, "static")
+
+TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css",
+    ".js": "application/javascript",
+    ".svg": "image/svg+xml",
+    ".json": "application/json",
+}
+
+
+def main():
+    os.makedirs(OUT, exist_ok=True)
+    assets = {}
+    for name in sorted(os.listdir(SRC)):
+        ext = os.path.splitext(name)[1]
+        if ext not in TYPES:
+            continue
+        with open(os.path.join(SRC, name), "rb") as f:
+            data = f.read()
+        # mtime=0 keeps the output (and so the ETag) identical between builds
+        blob = gzip.compress(data, 9, mtime=0)
+        with open(os.path.join(OUT, name + ".gz"), "wb") as f:
+            f.write(blob)
+        assets[name] = {"type": TYPES[ext], "etag": hashlib.sha256(blob).hexdigest()[:16]}
+        print("{}: {} -> {} bytes".format(name, len(data), len(blob)))
+    with open(os.path.join(OUT, "assets.json"), "w") as f:
+        json.dump(assets, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# codec_bench.py
+# On-device benchmark for codec.py: encode/decode time and heap per message for
+# the binary format against the JSON fallback, and bytes on the wire for each.
+# Runs on the board, with codec.py already on its filesystem:
+#
+#   mpremote run tools/codec_bench.py
+
+import gc
+import json
+import time
+import codec
+
+N = 500
+
+CASES = (
+    ("touch", codec.MSG_TOUCH, (412,)),
+    ("status", codec.MSG_STATUS, (-61, 97, 86400)),
+    ("gesture", codec.MSG_GESTURE, (2, 360)),
+)
+
+
+def bench(fn, arg):
+    """Returns (us per call, heap bytes allocated per call)."""
+    gc.collect()
+    gc.disable()
+    a0 = gc.mem_alloc()
+    t0 = time.ticks_us()
+    for _ in range(N):
+        fn(arg)
+    us = time.ticks_diff(time.ticks_us(), t0)
+    alloc = gc.mem_alloc() - a0
+    gc.enable()
+    return us / N, alloc // N
+
+
+def main():
+    print("{} calls each; time in us, heap in bytes per call".format(N))
+    print("{:<8} {:>6} {:>6}  ".format("type", "bin B", "json B") + " ".join("{:>14}".format(h) for h in (
+        "encode", "encode_json", "decode(bin)", "json.loads", "decode(json)")))
+    for name, msg_type, values in CASES:
+        binary = codec.encode(msg_type, *values)
+        text = codec.encode_json(msg_type, *values)
+        raw = text.encode()
+        cols = (
+            bench(lambda v: codec.encode(msg_type, *v), values),
+            bench(lambda v: codec.encode_json(msg_type, *v), values),
+            bench(codec.decode, binary),
+            bench(json.loads, text),
+            bench(codec.decode, raw),
+        )
+        print("{:<8} {:>6} {:>6}  ".format(name, len(binary), len(raw)) +
+              " ".join("{:>8.1f} /{:>4}".format(us, alloc) for us, alloc in cols))
+
+
+main()
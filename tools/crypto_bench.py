@@ -0,0 +1,115 @@
+# crypto_bench.py
+# On-device benchmark for crypto.py on a config of several KB: the old
+# per-byte list comprehension against xor_into (viper and pure Python), the
+# streaming Reader feeding json.load from flash, and AES-CTR when cryptolib
+# is available. Reports time and the heap each call allocates.
+# Runs on the board, with crypto.py already on its filesystem:
+#
+#   mpremote run tools/crypto_bench.py
+
+import gc
+import json
+import os
+import time
+import crypto
+
+SIZE = 6144
+RUNS = 3
+FILE = "bench_cfg.dat"
+AES_FILE = "bench_aes.dat"
+
+
+def make_config(size):
+    cfg = {"url": "wss://broker.example.com/mqtt", "user": "device", "pass": "x" * 24,
+           "pub_topic": "touch", "sub_topics": [], "versions": {}}
+    n = 0
+    while len(json.dumps(cfg)) < size:
+        cfg["sub_topics"].append("home/room{}/light".format(n))
+        cfg["versions"]["module{}.py".format(n)] = "%064x" % (n * 2654435761)
+        n += 1
+    return json.dumps(cfg).encode()
+
+
+def old_xor(data):
+    # The routine crypto.py replaced
+    key = crypto.KEY
+    return bytes([data[i] ^ key[i % len(key)] for i in range(len(data))])
+
+
+def bench(fn):
+    """Best ms over RUNS calls, and heap bytes allocated by one call."""
+    best = None
+    alloc = 0
+    for _ in range(RUNS):
+        gc.collect()
+        gc.disable()
+        a0 = gc.mem_alloc()
+        t0 = time.ticks_us()
+        try:
+            fn()
+        except MemoryError:
+            gc.enable()
+            return None, None
+        us = time.ticks_diff(time.ticks_us(), t0)
+        alloc = gc.mem_alloc() - a0
+        gc.enable()
+        best = us if best is None else min(best, us)
+    return best / 1000, alloc
+
+
+def main():
+    plain = make_config(SIZE)
+    buf = bytearray(plain)
+    cipher = old_xor(plain)
+    with open(FILE, "wb") as f:
+        f.write(cipher)
+
+    def read_old():
+        with open(FILE, "rb") as f:
+            return json.loads(old_xor(f.read()))
+
+    def read_stream(path=FILE):
+        with open(path, "rb") as f:
+            return json.load(crypto.Reader(f))
+
+    cases = [
+        ("list comprehension", lambda: old_xor(plain)),
+        ("xor_into (python)", lambda: crypto._xor_py(buf, len(buf), crypto.KEY, len(crypto.KEY), 0)),
+    ]
+    if crypto._xor is not crypto._xor_py:
+        cases.append(("xor_into (viper)", lambda: crypto.xor_into(buf, len(buf))))
+    cases += [
+        ("load: read + xor + loads", read_old),
+        ("load: Reader + json.load", read_stream),
+    ]
+    if crypto.cryptolib:
+        key = crypto._aes_key()
+        out = bytearray(len(buf))
+        iv = bytes(16)
+        cases.append(("AES-CTR (cryptolib)", lambda: crypto.cryptolib.aes(key, crypto._AES_CTR, iv).encrypt(buf, out)))
+        with open(AES_FILE, "wb") as f:
+            crypto.Writer(f, crypto.MODE_AES).write(plain)
+        assert read_stream(AES_FILE) == json.loads(plain)
+        cases.append(("load: AES Reader + json.load", lambda: read_stream(AES_FILE)))
+    else:
+        print("cryptolib not available, AES-CTR skipped")
+
+    # Every path must give back the same config
+    assert read_stream() == json.loads(plain)
+
+    print("{} B config, best of {}".format(len(plain), RUNS))
+    print("{:<30} {:>9} {:>9}".format("", "ms", "alloc B"))
+    for name, fn in cases:
+        ms, alloc = bench(fn)
+        if ms is None:
+            print("{:<30} {:>9}".format(name, "MemoryError"))
+        else:
+            print("{:<30} {:>9.2f} {:>9}".format(name, ms, alloc))
+    for path in (FILE, AES_FILE):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+main()
@@ -0,0 +1,84 @@
+# dns_bench.py
+# Host-side (CPython) benchmark for the captive DNS responder: keeps a window
+# of queries in flight over UDP and reports answered queries per second.
+#
+#   python tools/dns_bench.py                        # responder at 192.168.4.1
+#   python tools/dns_bench.py 127.0.0.1 -p 5353 -n 5000 -w 8
+
+import argparse
+import random
+import socket
+import struct
+import time
+
+NAMES = ("captive.apple.com", "connectivitycheck.gstatic.com", "www.msftconnecttest.com",
+         "clients3.google.com", "example.com")
+
+
+def build_query(qid, name, qtype):
+    q = struct.pack(">HHHHHH", qid, 0x0100, 1, 0, 0, 0)
+    for label in name.split("."):
+        q += bytes([len(label)]) + label.encode()
+    return q + b"\x00" + struct.pack(">HH", qtype, 1)
+
+
+def check(resp, qtype):
+    """Returns the answered IPv4 address, "" for an empty answer, or None if malformed."""
+    if len(resp) < 12:
+        return None
+    flags, qd, an = struct.unpack_from(">HHH", resp, 2)
+    if not flags & 0x8000 or qd != 1:
+        return None
+    if qtype != 1:
+        return "" if an == 0 else None
+    if an != 1:
+        return None
+    return ".".join(str(b) for b in resp[-4:])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("host", nargs="?", default="192.168.4.1")
+    parser.add_argument("-p", "--port", type=int, default=53)
+    parser.add_argument("-n", "--queries", type=int, default=2000)
+    parser.add_argument("-w", "--window", type=int, default=4, help="queries in flight")
+    parser.add_argument("--aaaa", type=float, default=0.3, help="share of AAAA queries")
+    args = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(1.0)
+    dest = (args.host, args.port)
+    pending = {}
+    sent = answered = bad = lost = 0
+    addrs = set()
+    t0 = time.monotonic()
+    while answered + bad + lost < args.queries:
+        while sent < args.queries and len(pending) < args.window:
+            qid = sent & 0xFFFF
+            qtype = 28 if random.random() < args.aaaa else 1
+            sock.sendto(build_query(qid, NAMES[sent % len(NAMES)], qtype), dest)
+            pending[qid] = qtype
+            sent += 1
+        try:
+            resp, _ = sock.recvfrom(512)
+        except socket.timeout:
+            lost += len(pending)
+            pending.clear()
+            continue
+        qid = struct.unpack_from(">H", resp)[0]
+        qtype = pending.pop(qid, None)
+        result = check(resp, qtype) if qtype else None
+        if result is None:
+            bad += 1
+        else:
+            answered += 1
+            if result:
+                addrs.add(result)
+    wall = time.monotonic() - t0
+    print("{} queries in {:.2f} s: {:.0f} answered/s, {} bad, {} lost".format(
+        args.queries, wall, answered / wall if wall else 0, bad, lost))
+    print("A answers:", ", ".join(sorted(addrs)) or "none")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# hostenv.py
+# MicroPython stand-ins so the host-side (CPython) tools can drive device
+# modules such as ota.py and slots.py off the board. Covers only what those
+# modules use: time.ticks_*, uasyncio (sleep_ms, StreamReader.readinto),
+# machine.unique_id/reset, ubinascii and deflate.DeflateIO.
+#
+#   import hostenv
+#   hostenv.install()
+#   import ota
+
+import asyncio
+import binascii
+import os
+import sys
+import time
+import types
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stands in for machine.unique_id(), so crypto and codec output is stable
+DEVICE_ID = b"\x24\x0a\xc4\x00\x00\x01"
+
+
+async def _sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+async def _readinto(self, buf):
+    data = await self.read(len(buf))
+    buf[:len(data)] = data
+    return len(data)
+
+
+class DeflateIO:
+    """deflate.DeflateIO over zlib.decompressobj, for reading only."""
+    def __init__(self, stream, fmt, wbits):
+        self.stream = stream
+        self.d = zlib.decompressobj({GZIP: 16 + wbits, ZLIB: wbits, RAW: -wbits}[fmt])
+        self.pending = b""
+
+    def readinto(self, buf):
+        while not self.pending:
+            chunk = self.stream.read(256)
+            if not chunk:
+                self.pending = self.d.flush()
+                break
+            self.pending = self.d.decompress(chunk)
+        n = min(len(buf), len(self.pending))
+        buf[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+
+RAW = 1
+ZLIB = 2
+GZIP = 3
+
+
+def _reset():
+    raise SystemExit("machine.reset()")
+
+
+class _RTC:
+    def __init__(self):
+        # No RTC memory here: reset_detect falls back to the state journal
+        raise OSError("no RTC on the host")
+
+
+def _module(name, **attrs):
+    mod = types.ModuleType(name)
+    mod.__dict__.update(attrs)
+    sys.modules[name] = mod
+    return mod
+
+
+def install():
+    """Registers the stand-ins and puts the repo root on sys.path. Safe to call twice."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    if "uasyncio" in sys.modules:
+        return
+
+    time.ticks_ms = lambda: int(time.monotonic() * 1000)
+    time.ticks_us = lambda: int(time.monotonic() * 1000000)
+    time.ticks_diff = lambda a, b: a - b
+    time.ticks_add = lambda a, b: a + b
+    time.sleep_ms = lambda n: time.sleep(n / 1000)
+
+    asyncio.StreamReader.readinto = _readinto
+    uasyncio = _module("uasyncio", **{k: getattr(asyncio, k) for k in dir(asyncio) if not k.startswith("__")})
+    uasyncio.sleep_ms = _sleep_ms
+
+    _module("machine", unique_id=lambda: DEVICE_ID, reset=_reset, RTC=_RTC)
+    _module("ubinascii", hexlify=binascii.hexlify, unhexlify=binascii.unhexlify,
+            a2b_base64=binascii.a2b_base64, b2a_base64=binascii.b2a_base64)
+    _module("deflate", DeflateIO=DeflateIO, RAW=RAW, ZLIB=ZLIB, GZIP=GZIP)
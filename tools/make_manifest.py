@@ -0,0 +1,107 @@
+# make_manifest.py
+# Host-side (CPython) helper: refreshes the per-file digests in versions.json.
+#
+#   python tools/make_manifest.py                      # update "files" for every versioned file
+#   python tools/make_manifest.py --bump led_touch.py 1.10
+#   python tools/make_manifest.py --gzip               # also publish gz/<file>.gz artifacts
+#   python tools/make_manifest.py --mpy [--march xtensawin]   # also publish mpy/<module>.mpy (needs mpy-cross)
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST = os.path.join(ROOT, "versions.json")
+
+# Must match ota.WINDOW_BITS; the device decompresses with this window
+WINDOW_BITS = 10
+
+# Must match ota.MPY_ARCHS / ota.NO_MPY
+MPY_ARCHS = (None, "x86", "x64", "armv6", "armv6m", "armv7m", "armv7em",
+             "armv7emsp", "armv7emdp", "xtensa", "xtensawin", "rv32imc")
+NO_MPY = ("main.py", "boot.py")
+
+
+def file_meta(data):
+    return {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+
+
+def gzip_artifact(name, data):
+    comp = zlib.compressobj(9, zlib.DEFLATED, 16 + WINDOW_BITS)
+    blob = comp.compress(data) + comp.flush()
+    if len(blob) >= len(data):
+        return None
+    rel = "gz/{}.gz".format(name)
+    os.makedirs(os.path.join(ROOT, "gz"), exist_ok=True)
+    with open(os.path.join(ROOT, rel), "wb") as f:
+        f.write(blob)
+    return {"path": rel, "format": "gzip", "size": len(blob)}
+
+
+def mpy_artifact(name, march):
+    rel = "mpy/{}.mpy".format(name[:-3])
+    out = os.path.join(ROOT, rel)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    cmd = ["mpy-cross", "-o", out]
+    if march:
+        cmd.append("-march=" + march)
+    subprocess.check_call(cmd + [os.path.join(ROOT, name)])
+    with open(out, "rb") as f:
+        data = f.read()
+    # Header: b"M", version, (arch << 2) | sub-version, ...
+    arch = data[2] >> 2
+    art = file_meta(data)
+    art.update({"path": rel, "version": data[1], "sub": data[2] & 3,
+                "arch": MPY_ARCHS[arch] if arch < len(MPY_ARCHS) else None})
+    return art
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bump", nargs=2, metavar=("FILE", "VERSION"))
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--mpy", action="store_true")
+    parser.add_argument("--march")
+    args = parser.parse_args()
+
+    with open(MANIFEST) as f:
+        manifest = json.load(f)
+
+    if args.bump:
+        # Kept as given: float() would turn "1.10" into 1.1
+        manifest[args.bump[0]] = args.bump[1]
+
+    old_files = manifest.get("files", {})
+    files = {}
+    for name, version in manifest.items():
+        if name == "files":
+            continue
+        with open(os.path.join(ROOT, name), "rb") as f:
+            data = f.read()
+        meta = file_meta(data)
+        # Patches and artifacts only stay valid while their target content is unchanged
+        old = old_files.get(name, {})
+        if old.get("sha256") == meta["sha256"]:
+            for key in ("patches", "compressed", "mpy"):
+                if key in old:
+                    meta[key] = old[key]
+        if args.gzip:
+            comp = gzip_artifact(name, data)
+            if comp:
+                meta["compressed"] = comp
+        if args.mpy and name.endswith(".py") and name not in NO_MPY:
+            meta["mpy"] = [mpy_artifact(name, args.march)]
+        files[name] = meta
+    manifest["files"] = files
+
+    with open(MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    print("Updated", MANIFEST)
+
+
+if __name__ == "__main__":
+    main()
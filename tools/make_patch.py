@@ -0,0 +1,93 @@
+# make_patch.py
+# Host-side (CPython) helper: builds a delta patch from an older copy of a file
+# to the current one and registers it in versions.json.
+#
+#   git show HEAD~1:led_touch.py > /tmp/old_led_touch.py
+#   python tools/make_patch.py led_touch.py /tmp/old_led_touch.py
+#
+# Run make_manifest.py first so the target digest is current.
+
+import difflib
+import hashlib
+import json
+import os
+import struct
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST = os.path.join(ROOT, "versions.json")
+
+# Copies shorter than this cost more in op headers than they save
+MIN_COPY = 12
+
+
+def build_patch(old, new):
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    pending = bytearray()
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal" and (i2 - i1) >= MIN_COPY:
+            if pending:
+                ops.append(b"I" + struct.pack(">I", len(pending)) + bytes(pending))
+                pending = bytearray()
+            ops.append(b"C" + struct.pack(">II", i1, i2 - i1))
+        else:
+            pending += new[j1:j2]
+    if pending:
+        ops.append(b"I" + struct.pack(">I", len(pending)) + bytes(pending))
+    return b"DP1" + b"".join(ops) + b"E"
+
+
+def apply_patch(old, patch):
+    assert patch[:3] == b"DP1"
+    out = bytearray()
+    pos = 3
+    while patch[pos:pos + 1] != b"E":
+        op = patch[pos:pos + 1]
+        if op == b"C":
+            offset, length = struct.unpack_from(">II", patch, pos + 1)
+            out += old[offset:offset + length]
+            pos += 9
+        else:
+            length, = struct.unpack_from(">I", patch, pos + 1)
+            out += patch[pos + 5:pos + 5 + length]
+            pos += 5 + length
+    return bytes(out)
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("usage: make_patch.py <file> <old copy>")
+        return 1
+    name, old_path = argv
+    with open(os.path.join(ROOT, name), "rb") as f:
+        new = f.read()
+    with open(old_path, "rb") as f:
+        old = f.read()
+
+    with open(MANIFEST) as f:
+        manifest = json.load(f)
+    entry = manifest.get("files", {}).get(name)
+    if not entry or entry["sha256"] != hashlib.sha256(new).hexdigest():
+        print("Manifest is stale for", name, "- run make_manifest.py first")
+        return 1
+
+    patch = build_patch(old, new)
+    assert apply_patch(old, patch) == new
+
+    old_sha = hashlib.sha256(old).hexdigest()
+    rel = "patches/{}/{}.bin".format(name, old_sha[:16])
+    os.makedirs(os.path.dirname(os.path.join(ROOT, rel)), exist_ok=True)
+    with open(os.path.join(ROOT, rel), "wb") as f:
+        f.write(patch)
+
+    entry.setdefault("patches", {})[old_sha] = {"path": rel, "size": len(patch)}
+    with open(MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    print("Wrote {} ({} bytes, full file {} bytes)".format(rel, len(patch), len(new)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,129 @@
+# mpy_bench.py
+# Host-side (CPython) driver for comparing .py and precompiled .mpy imports on
+# the board: compiles each module with mpy-cross, copies both forms to scratch
+# directories on the device, then imports each several times over mpremote and
+# reports import time, heap allocated during the import (compiler included)
+# and heap still held afterwards. Needs mpremote and mpy-cross on PATH, and the
+# board at the REPL (not running the app).
+#
+#   python tools/mpy_bench.py                       # led_touch.py ws_mqtt.py ws.py wifimanager.py
+#   python tools/mpy_bench.py ws_mqtt.py -n 5 --march xtensawin -d /dev/ttyUSB0
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("led_touch.py", "ws_mqtt.py", "ws.py", "wifimanager.py")
+PY_DIR = "bench_py"
+MPY_DIR = "bench_mpy"
+
+# Runs on the board. A first import from PY_DIR loads the module's own imports,
+# so both forms are measured with those already in sys.modules.
+DEVICE_CODE = """
+import sys, gc, time, os
+
+def measure(d, name):
+    sys.modules.pop(name, None)
+    sys.path.insert(0, d)
+    gc.collect()
+    free0 = gc.mem_free()
+    gc.disable()
+    try:
+        t0 = time.ticks_us()
+        __import__(name)
+        us = time.ticks_diff(time.ticks_us(), t0)
+        alloc = free0 - gc.mem_free()
+    except MemoryError:
+        us = alloc = -1
+    gc.enable()
+    gc.collect()
+    kept = free0 - gc.mem_free()
+    sys.path.pop(0)
+    sys.modules.pop(name, None)
+    print("R", d, name, us, alloc, kept)
+
+for name in NAMES:
+    measure(PY_DIR, name)
+    for _ in range(RUNS):
+        measure(PY_DIR, name)
+        measure(MPY_DIR, name)
+
+for d in (PY_DIR, MPY_DIR):
+    for f in os.listdir(d):
+        os.remove(d + "/" + f)
+    os.rmdir(d)
+"""
+
+
+def mpremote(args, device, check=True):
+    cmd = ["mpremote"]
+    if device:
+        cmd += ["connect", device]
+    res = subprocess.run(cmd + args, capture_output=True, text=True)
+    if check and res.returncode:
+        sys.exit("mpremote {} failed:\n{}".format(args[0], res.stderr or res.stdout))
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("-n", "--runs", type=int, default=3)
+    parser.add_argument("-d", "--device", help="mpremote connect target, e.g. /dev/ttyUSB0")
+    parser.add_argument("--march", help="mpy-cross -march, for modules with native code")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="mpy_bench_")
+    sizes = {}
+    for d in (PY_DIR, MPY_DIR):
+        mpremote(["fs", "mkdir", ":" + d], args.device, check=False)
+    for fname in args.modules:
+        src = os.path.join(ROOT, fname)
+        mpy = os.path.join(tmp, fname[:-3] + ".mpy")
+        cmd = ["mpy-cross", "-o", mpy]
+        if args.march:
+            cmd.append("-march=" + args.march)
+        subprocess.check_call(cmd + [src])
+        mpremote(["fs", "cp", src, ":{}/{}".format(PY_DIR, fname)], args.device)
+        mpremote(["fs", "cp", mpy, ":{}/{}".format(MPY_DIR, os.path.basename(mpy))], args.device)
+        sizes[fname[:-3]] = (os.path.getsize(src), os.path.getsize(mpy))
+
+    code = "NAMES = {!r}\nRUNS = {}\nPY_DIR = {!r}\nMPY_DIR = {!r}\n".format(
+        list(sizes), args.runs, PY_DIR, MPY_DIR) + DEVICE_CODE
+    out = mpremote(["exec", code], args.device).stdout
+
+    # name -> dir -> [(us, alloc, kept)], first (warm-up) row dropped
+    results = {}
+    seen = set()
+    for line in out.splitlines():
+        parts = line.split()
+        if len(parts) != 6 or parts[0] != "R":
+            continue
+        d, name = parts[1], parts[2]
+        if (d, name) not in seen and d == PY_DIR:
+            seen.add((d, name))
+            continue
+        results.setdefault(name, {}).setdefault(d, []).append(tuple(int(p) for p in parts[3:]))
+
+    print("{:<12} {:>7} {:>7}  {:>9} {:>9}  {:>10} {:>10}  {:>9} {:>9}".format(
+        "module", "py B", "mpy B", "py ms", "mpy ms", "py alloc", "mpy alloc", "py kept", "mpy kept"))
+    failed = False
+    for name, (py_size, mpy_size) in sizes.items():
+        rows = results.get(name, {})
+        py, mp = rows.get(PY_DIR), rows.get(MPY_DIR)
+        if not py or not mp or any(r[0] < 0 for r in py + mp):
+            print("{:<12} import failed (out of memory or not found)".format(name))
+            failed = True
+            continue
+        best = lambda rs, i: min(r[i] for r in rs)
+        print("{:<12} {:>7} {:>7}  {:>9.1f} {:>9.1f}  {:>10} {:>10}  {:>9} {:>9}".format(
+            name, py_size, mpy_size, best(py, 0) / 1000, best(mp, 0) / 1000,
+            best(py, 1), best(mp, 1), best(py, 2), best(mp, 2)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
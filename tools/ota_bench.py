@@ -0,0 +1,103 @@
+# ota_bench.py
+# Host-side (CPython) throughput benchmark for OTA downloads: runs
+# ota.OTAUpdater._download_full against ota_standin.py on localhost for a range
+# of chunk sizes (128 B is what the old res.raw.read(128) loop used), checking
+# every download against its manifest digest.
+#
+# The numbers measure the per-chunk cost of the download loop, not the ESP32's
+# radio or flash; compare rows with each other, not with the board.
+#
+#   python tools/ota_bench.py
+#   python tools/ota_bench.py --size 262144 -n 5 --gzip
+
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import zlib
+
+import hostenv
+hostenv.install()
+
+import ota  # noqa: E402
+import ota_standin  # noqa: E402
+
+CHUNKS = (128, 256, 512, 1024, 2048, 4096)
+NAME = "payload.py"
+
+
+def make_payload(size):
+    # Repo sources, repeated: compresses like a real OTA file would
+    src = b""
+    for name in sorted(os.listdir(hostenv.ROOT)):
+        if name.endswith(".py"):
+            with open(os.path.join(hostenv.ROOT, name), "rb") as f:
+                src += f.read()
+    return (src * (size // len(src) + 1))[:size]
+
+
+def publish(root, data, compress):
+    with open(os.path.join(root, NAME), "wb") as f:
+        f.write(data)
+    meta = {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+    if compress:
+        # Same window the device inflates with
+        comp = zlib.compressobj(9, zlib.DEFLATED, 16 + ota.WINDOW_BITS)
+        blob = comp.compress(data) + comp.flush()
+        with open(os.path.join(root, NAME + ".gz"), "wb") as f:
+            f.write(blob)
+        meta["compressed"] = {"path": NAME + ".gz", "format": "gzip", "size": len(blob)}
+    return meta
+
+
+async def one(url, chunk, meta):
+    updater = ota.OTAUpdater(url, [NAME], chunk)
+    t0 = time.perf_counter()
+    try:
+        ok = await updater._download_full(NAME, meta)
+    finally:
+        await updater.http.close()
+    return ok, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=65536, help="payload bytes")
+    parser.add_argument("-n", "--runs", type=int, default=3, help="runs per chunk size; the best is kept")
+    parser.add_argument("--gzip", action="store_true", help="serve a gzip artifact as well")
+    parser.add_argument("--chunks", help="comma-separated chunk sizes")
+    args = parser.parse_args()
+    chunks = [int(c) for c in args.chunks.split(",")] if args.chunks else CHUNKS
+
+    served = tempfile.mkdtemp(prefix="ota_served_")
+    work = tempfile.mkdtemp(prefix="ota_device_")
+    data = make_payload(args.size)
+    meta = publish(served, data, args.gzip)
+    server = ota_standin.serve(served)
+    url = "http://127.0.0.1:{}/".format(server.port)
+    # ota.py writes its temp files and the state journal to the working directory
+    os.chdir(work)
+
+    print("{} B payload{}, best of {}".format(
+        len(data), ", gzip {} B on the wire".format(meta["compressed"]["size"]) if args.gzip else "", args.runs))
+    print("{:>6}  {:>9}  {:>9}  {:>8}".format("chunk", "ms", "MB/s", "verified"))
+    failed = False
+    for chunk in chunks:
+        best = None
+        ok_all = True
+        for _ in range(args.runs):
+            ok, secs = asyncio.run(one(url, chunk, meta))
+            ok_all = ok_all and ok
+            best = secs if best is None else min(best, secs)
+        failed = failed or not ok_all
+        print("{:>6}  {:>9.1f}  {:>9.2f}  {:>8}".format(
+            chunk, best * 1000, len(data) / best / 1e6, "yes" if ok_all else "NO"))
+    server.shutdown()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# ota_resume_test.py
+# Host-side (CPython) test of resumable OTA downloads: ota_standin.py drops
+# every connection partway through the body, and each retry (a fresh
+# OTAUpdater, as after a reboot) must pick up where the last one stopped with
+# a Range request, without fetching any byte twice, and install a file that
+# matches the manifest digest. Also covers a host that ignores Range, a
+# partial left from a different build, and a spool that is already complete.
+#
+#   python tools/ota_resume_test.py
+#   python tools/ota_resume_test.py --size 100000 --cut 3000
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import zlib
+
+import hostenv
+hostenv.install()
+
+import ota  # noqa: E402
+import ota_standin  # noqa: E402
+
+NAME = "payload.py"
+
+
+class Case:
+    def __init__(self, root, server, size):
+        self.root = root
+        self.server = server
+        self.url = "http://127.0.0.1:{}/".format(server.port)
+        self.size = size
+        self.failures = []
+
+    def check(self, cond, msg):
+        if not cond:
+            self.failures.append(msg)
+
+    def publish(self, data, compress=False):
+        with open(os.path.join(self.root, NAME), "wb") as f:
+            f.write(data)
+        meta = {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+        if compress:
+            comp = zlib.compressobj(9, zlib.DEFLATED, 16 + ota.WINDOW_BITS)
+            blob = comp.compress(data) + comp.flush()
+            with open(os.path.join(self.root, NAME + ".gz"), "wb") as f:
+                f.write(blob)
+            meta["compressed"] = {"path": NAME + ".gz", "format": "gzip", "size": len(blob)}
+        return meta
+
+    def attempt(self, meta):
+        """One download as a fresh boot would run it. Returns (ok, stats, report line)."""
+        async def run():
+            updater = ota.OTAUpdater(self.url, [NAME], 1024)
+            try:
+                ok = await updater._download_full(NAME, meta)
+            finally:
+                await updater.http.close()
+            return ok, updater
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            ok, updater = asyncio.run(run())
+            updater._report()
+        return ok, updater.stats, out.getvalue().strip().splitlines()[-1]
+
+    def installed_ok(self, data):
+        try:
+            with open(NAME, "rb") as f:
+                return f.read() == data
+        except OSError:
+            return False
+
+
+def payload(size, seed):
+    # Text-like, so the gzip case compresses as a real source file would
+    out = b""
+    n = 0
+    while len(out) < size:
+        out += "line {} of build {}: value = {}\n".format(n, seed, (n * 2654435761) % 100003).encode()
+        n += 1
+    return out[:size]
+
+
+def test_resume(case, cut, compress):
+    data = payload(case.size, 1)
+    meta = case.publish(data, compress)
+    on_wire = meta["compressed"]["size"] if compress else len(data)
+    case.server.cut_after = cut
+    del case.server.log[:]
+
+    ok = False
+    attempts = 0
+    limit = on_wire // cut + 2
+    while not ok and attempts < limit:
+        ok, stats, report = case.attempt(meta)
+        attempts += 1
+    case.check(ok, "never completed in {} attempts".format(limit))
+    case.check(case.installed_ok(data), "installed file differs from the published one")
+
+    sent = sum(r[3] for r in case.server.log)
+    case.check(sent == on_wire, "{} body bytes sent for a {} B artifact".format(sent, on_wire))
+    offset = 0
+    for path, status, rng, n in case.server.log:
+        want = "bytes={}-".format(offset) if offset else None
+        case.check(rng == want, "request {} sent Range {!r}, expected {!r}".format(path, rng, want))
+        case.check(status == (206 if offset else 200), "status {} at offset {}".format(status, offset))
+        offset += n
+    case.check(stats["wire"] + stats["resumed"] == on_wire,
+               "final attempt counted {} + {} resumed B".format(stats["wire"], stats["resumed"]))
+    if not compress:
+        case.check("(0% saved)" in report, "uncompressed resume reported savings: " + report)
+    return "{} attempts, {} B sent; {}".format(attempts, sent, report)
+
+
+def test_range_ignored(case, cut):
+    data = payload(case.size, 2)
+    meta = case.publish(data)
+    case.server.cut_after = cut
+    ok, _, _ = case.attempt(meta)
+    case.check(not ok, "cut download reported success")
+    case.server.cut_after = None
+    case.server.ignore_range = True
+    del case.server.log[:]
+    ok, _, report = case.attempt(meta)
+    case.server.ignore_range = False
+    case.check(ok and case.installed_ok(data), "full restart after a 200 did not install the file")
+    case.check([r[1] for r in case.server.log] == [200], "expected one 200, got {}".format(case.server.log))
+    return report
+
+
+def test_new_build(case, cut):
+    old = payload(case.size, 3)
+    case.server.cut_after = cut
+    ok, _, _ = case.attempt(case.publish(old))
+    case.check(not ok, "cut download reported success")
+    data = payload(case.size, 4)
+    meta = case.publish(data)
+    case.server.cut_after = None
+    del case.server.log[:]
+    ok, _, report = case.attempt(meta)
+    case.check(ok and case.installed_ok(data), "download of the new build failed")
+    case.check(case.server.log and case.server.log[0][2] is None,
+               "partial of the old build was resumed: {}".format(case.server.log[:1]))
+    return report
+
+
+def test_complete_spool(case):
+    data = payload(case.size, 5)
+    meta = case.publish(data)
+    # A previous attempt wrote every byte but died before installing
+    with open("tmp_" + NAME, "wb") as f:
+        f.write(data)
+    with open("tmp_" + NAME + ".part", "w") as f:
+        f.write('{{"src": "{}", "sha256": "{}"}}'.format(NAME, meta["sha256"]))
+    case.server.cut_after = None
+    del case.server.log[:]
+    ok, _, report = case.attempt(meta)
+    case.check(ok and case.installed_ok(data), "complete spool was not recovered")
+    case.check([r[1] for r in case.server.log] == [416, 200], "expected 416 then 200, got {}".format(
+        [r[1] for r in case.server.log]))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=40000, help="payload bytes")
+    parser.add_argument("--cut", type=int, default=6000, help="body bytes per connection before it drops")
+    args = parser.parse_args()
+
+    served = tempfile.mkdtemp(prefix="ota_served_")
+    work = tempfile.mkdtemp(prefix="ota_device_")
+    server = ota_standin.serve(served)
+    # ota.py writes its temp files and the state journal to the working directory
+    os.chdir(work)
+
+    tests = (
+        ("resume", lambda c: test_resume(c, args.cut, False)),
+        ("resume gzip", lambda c: test_resume(c, max(1, args.cut // 4), True)),
+        ("range ignored", lambda c: test_range_ignored(c, args.cut)),
+        ("new build", lambda c: test_new_build(c, args.cut)),
+        ("complete spool", test_complete_spool),
+    )
+    failed = False
+    for name, fn in tests:
+        for f in os.listdir(work):
+            os.remove(f)
+        case = Case(served, server, args.size)
+        try:
+            detail = fn(case)
+        except Exception as e:
+            case.failures.append("{}: {}".format(type(e).__name__, e))
+            detail = ""
+        if case.failures:
+            failed = True
+            print("FAIL", name)
+            for msg in case.failures:
+                print("  ", msg)
+        else:
+            print("ok  ", name, "-", detail)
+
+    server.shutdown()
+    os.chdir(hostenv.ROOT)
+    shutil.rmtree(served)
+    shutil.rmtree(work)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
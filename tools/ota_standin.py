@@ -0,0 +1,109 @@
+# ota_standin.py
+# Host-side (CPython) stand-in for the OTA file host: serves a directory over
+# HTTP/1.1 keep-alive with Range and ETag support, like raw.githubusercontent.com.
+# --cut-after drops the connection after that many body bytes of every
+# response, to mimic a Wi-Fi link going away mid-download.
+#
+# Used by ota_bench.py and ota_resume_test.py, or run on its own and point a
+# board's github_url at it:
+#
+#   python tools/ota_standin.py . -p 8000
+#   python tools/ota_standin.py . -p 8000 --cut-after 4096
+
+import argparse
+import hashlib
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, fmt, *args)
+
+    def do_GET(self):
+        srv = self.server
+        rel = self.path.split("?")[0].lstrip("/")
+        path = os.path.normpath(os.path.join(srv.root, rel))
+        if not path.startswith(srv.root) or not os.path.isfile(path):
+            self._reply(404, b"not found")
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        etag = '"{}"'.format(hashlib.sha256(data).hexdigest()[:16])
+        if self.headers.get("If-None-Match") == etag:
+            self._reply(304, b"", etag)
+            return
+
+        start = 0
+        rng = self.headers.get("Range")
+        if rng and not srv.ignore_range and rng.startswith("bytes=") and rng.endswith("-"):
+            start = int(rng[6:-1])
+            if start >= len(data):
+                self._reply(416, b"", etag, {"Content-Range": "bytes */{}".format(len(data))})
+                return
+            self._reply(206, data[start:], etag,
+                        {"Content-Range": "bytes {}-{}/{}".format(start, len(data) - 1, len(data))})
+        else:
+            self._reply(200, data, etag)
+
+    def _reply(self, status, body, etag=None, extra=None):
+        srv = self.server
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        for k, v in (extra or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        sent = body
+        if srv.cut_after is not None and len(body) > srv.cut_after:
+            sent = body[:srv.cut_after]
+        self.wfile.write(sent)
+        self.wfile.flush()
+        with srv.lock:
+            srv.log.append((self.path, status, self.headers.get("Range"), len(sent)))
+        if len(sent) < len(body):
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+
+
+def serve(root, port=0, cut_after=None, ignore_range=False, verbose=False, host="127.0.0.1"):
+    """Starts the server on a daemon thread. server.port is the bound port, server.log
+    lists (path, status, range, body bytes sent) per response."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.root = os.path.abspath(root)
+    server.cut_after = cut_after
+    server.ignore_range = ignore_range
+    server.verbose = verbose
+    server.log = []
+    server.lock = threading.Lock()
+    server.port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("root", nargs="?", default=".")
+    parser.add_argument("-p", "--port", type=int, default=8000)
+    parser.add_argument("--bind", default="0.0.0.0")
+    parser.add_argument("--cut-after", type=int, help="body bytes sent before dropping each connection")
+    parser.add_argument("--ignore-range", action="store_true", help="answer Range requests with a full 200")
+    args = parser.parse_args()
+
+    server = serve(args.root, args.port, args.cut_after, args.ignore_range, True, args.bind)
+    print("Serving {} on port {}".format(server.root, server.port))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# portal_load.py
+# Host-side (CPython) load test for the captive portal: many clients at once,
+# each sending several requests over one keep-alive connection, roughly what a
+# phone does when it joins the AP.
+#
+#   python tools/portal_load.py                      # portal at 192.168.4.1
+#   python tools/portal_load.py 127.0.0.1 -p 8080 -c 16 -n 10
+
+import argparse
+import http.client
+import threading
+import time
+
+PATHS = ("/", "/generate_204", "/hotspot-detect.html", "/favicon.ico")
+
+
+def client(host, port, requests, timeout, results, lock):
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    for i in range(requests):
+        path = PATHS[i % len(PATHS)]
+        t0 = time.monotonic()
+        try:
+            conn.request("GET", path)
+            res = conn.getresponse()
+            res.read()
+            ok, status = True, res.status
+        except Exception as e:
+            ok, status = False, type(e).__name__
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        with lock:
+            results.append((ok, status, time.monotonic() - t0))
+    conn.close()
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("host", nargs="?", default="192.168.4.1")
+    parser.add_argument("-p", "--port", type=int, default=80)
+    parser.add_argument("-c", "--clients", type=int, default=8, help="concurrent connections")
+    parser.add_argument("-n", "--requests", type=int, default=5, help="requests per connection")
+    parser.add_argument("-t", "--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    results = []
+    lock = threading.Lock()
+    threads = [threading.Thread(target=client, args=(args.host, args.port, args.requests, args.timeout, results, lock))
+               for _ in range(args.clients)]
+    t0 = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - t0
+
+    ok = [r[2] for r in results if r[0]]
+    errors = {}
+    for r in results:
+        if not r[0]:
+            errors[r[1]] = errors.get(r[1], 0) + 1
+    print("{} requests in {:.2f} s ({:.1f} req/s), {} failed".format(
+        len(results), wall, len(results) / wall if wall else 0, len(results) - len(ok)))
+    print("latency ms: p50 {:.0f}  p90 {:.0f}  max {:.0f}".format(
+        percentile(ok, 0.5) * 1000, percentile(ok, 0.9) * 1000, max(ok, default=0) * 1000))
+    for name, count in sorted(errors.items()):
+        print("  {}: {}".format(name, count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# touch_replay.py
+# Host-side (CPython) replay of recorded touch traces through touch.TouchEngine
+# and gesture.GestureRecognizer, to tune the filter and gesture timing
+# constants without the board.
+#
+# A trace is one sample per line, either "raw" or "t_ms,raw", captured at the
+# engine's sample period, e.g. by printing TouchPad.read() every 20 ms over
+# the serial console. Lines starting with "#" are ignored, except
+# "# expect: ..." and "# gestures: ...", which give the sequences the trace
+# must produce when --expect / --gestures aren't passed. The traces in
+# tools/traces/ carry both, so replaying them is a regression check. They are
+# synthetic, generated to the shape of the pad's readings rather than
+# recorded from a board; recorded traces should join them:
+#
+#   python tools/touch_replay.py tools/traces/*.csv
+#   python tools/touch_replay.py trace.csv
+#   python tools/touch_replay.py trace.csv --expect press,release,press,release
+#   python tools/touch_replay.py trace.csv --gestures double_tap,long_press
+#
+# --live plays the trace in real time through the same tasks the app runs:
+# a thread stands in for the machine.Timer callback, TouchEngine.run and
+# GestureRecognizer.run run on asyncio, and --busy blocks the loop for up to
+# that many ms at random moments, like a slow publish would.
+#
+#   python tools/touch_replay.py tools/traces/*.csv --live --busy 60
+
+import argparse
+import asyncio
+import random
+import sys
+import threading
+import time
+
+import hostenv
+hostenv.install()
+
+import touch  # noqa: E402
+import gesture  # noqa: E402
+
+NAMES = {touch.PRESS: "press", touch.RELEASE: "release"}
+
+
+def load(path, period_ms):
+    """Returns the samples as [(t_ms, raw)] and the expectations declared in the trace."""
+    samples = []
+    declared = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#"):
+                key, sep, value = line[1:].partition(":")
+                if sep and key.strip() in ("expect", "gestures"):
+                    declared[key.strip()] = value.strip()
+                continue
+            if not line:
+                continue
+            parts = line.split(",")
+            if len(parts) > 1:
+                samples.append((int(parts[0]), int(parts[1])))
+            else:
+                samples.append((len(samples) * period_ms, int(parts[0])))
+    return samples, declared
+
+
+def replay(samples):
+    engine = touch.TouchEngine(None)
+    recognizer = gesture.GestureRecognizer()
+    events = []
+    gestures = []
+    for t, raw in samples:
+        kind = engine.feed(raw, t)
+        if kind:
+            events.append((t, NAMES[kind], engine.value, engine.baseline()))
+            recognizer.feed(kind, t)
+        else:
+            recognizer.poll(t)
+        while recognizer.events.items:
+            g, gt, duration = recognizer.events.items.pop(0)
+            gestures.append((gt, gesture.NAMES[g], duration, t))
+    return engine, events, gestures
+
+
+class LiveEngine(touch.TouchEngine):
+    """TouchEngine that also logs its edges, since the recognizer consumes the queue."""
+    def __init__(self, pad, period_ms):
+        touch.TouchEngine.__init__(self, pad, period_ms)
+        self.log = []
+
+    def feed(self, raw, now=None):
+        kind = touch.TouchEngine.feed(self, raw, now)
+        if kind:
+            self.log.append((now, NAMES[kind], self.value, self.baseline()))
+        return kind
+
+
+class TracePad:
+    def __init__(self, samples):
+        self.values = [raw for _, raw in samples]
+        self.i = 0
+
+    def read(self):
+        # Holds the last value once the trace runs out
+        v = self.values[min(self.i, len(self.values) - 1)]
+        self.i += 1
+        return v
+
+
+async def _hog(busy_ms):
+    while True:
+        await asyncio.sleep(random.uniform(0, 0.2))
+        time.sleep(random.uniform(0, busy_ms) / 1000)
+
+
+async def _live(samples, period_ms, busy_ms):
+    engine = LiveEngine(TracePad(samples), period_ms)
+    recognizer = gesture.GestureRecognizer()
+    # One more second of the last value lets pending timeouts fire
+    count = len(samples) + 1000 // period_ms
+    t0 = time.ticks_ms()
+
+    def timer():
+        due = time.monotonic()
+        for _ in range(count):
+            engine._sample(None)
+            due += period_ms / 1000
+            time.sleep(max(0, due - time.monotonic()))
+
+    th = threading.Thread(target=timer, daemon=True)
+    th.start()
+    tasks = [asyncio.create_task(engine.run()), asyncio.create_task(recognizer.run(engine))]
+    if busy_ms:
+        tasks.append(asyncio.create_task(_hog(busy_ms)))
+    while th.is_alive():
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(period_ms * 8 / 1000)
+    for task in tasks:
+        task.cancel()
+    events = [(t - t0, name, value, base) for t, name, value, base in engine.log]
+    gestures = []
+    for g, t, duration in recognizer.events.items:
+        gestures.append((t - t0, gesture.NAMES[g], duration, None))
+    return engine, events, gestures
+
+
+def replay_live(samples, period_ms, busy_ms):
+    return asyncio.run(_live(samples, period_ms, busy_ms))
+
+
+def compare(label, want, got):
+    want = [e for e in want.split(",") if e]
+    if got != want:
+        print("  MISMATCH ({}): expected {}".format(label, want))
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("traces", nargs="+")
+    parser.add_argument("--period", type=int, default=touch.PERIOD_MS, help="ms per sample for traces without times")
+    parser.add_argument("--expect", help="comma-separated event sequence, e.g. press,release")
+    parser.add_argument("--gestures", help="comma-separated gesture sequence without releases, e.g. tap,long_press")
+    parser.add_argument("--live", action="store_true", help="play the trace in real time through the asyncio tasks")
+    parser.add_argument("--busy", type=int, default=0, help="with --live, block the loop for up to this many ms at a time")
+    args = parser.parse_args()
+
+    failed = False
+    for path in args.traces:
+        samples, declared = load(path, args.period)
+        if args.live:
+            engine, events, gestures = replay_live(samples, args.period, args.busy)
+        else:
+            engine, events, gestures = replay(samples)
+        print("{}: {} events, final baseline {}".format(path, len(events), engine.baseline()))
+        for t, name, value, base in events:
+            print("  {:>7} ms  {:<7}  value {:>5}  baseline {:>5}".format(t, name, value, base))
+        for t, name, duration, seen in gestures:
+            print("  {:>7} ms  {:<10}  {:>5} ms{}".format(
+                t, name, duration, "" if seen is None else "  (decided at {} ms)".format(seen)))
+        expect = args.expect if args.expect is not None else declared.get("expect")
+        if expect is not None:
+            failed |= not compare("events", expect, [e[1] for e in events])
+        want = args.gestures if args.gestures is not None else declared.get("gestures")
+        if want is not None:
+            got = [g[1] for g in gestures if g[1] != "release"]
+            failed |= not compare("gestures", want, got)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
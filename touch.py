@@ -0,0 +1,182 @@
+# touch.py
+# Timer-driven touch sampling: a machine.Timer callback reads the pad into a
+# ring buffer, and an asyncio task filters the samples and turns them into
+# debounced press/release events, so a slow publish or reconnect in the main
+# loop no longer delays touch detection.
+#
+# Per sample: median of the last 3 raw reads (drops single-sample spikes),
+# then an EMA. The pad reads lower when touched; a press is the filtered value
+# falling PRESS_PCT below the baseline for DEBOUNCE samples in a row, a release
+# is it rising back above RELEASE_PCT. The baseline follows slow drift
+# (humidity, temperature) while untouched.
+#
+# feed() runs the same processing on a value without the timer, for replaying
+# recorded traces (see tools/touch_replay.py).
+
+import time
+import uasyncio as asyncio
+from array import array
+
+PERIOD_MS = 20
+RING_SIZE = 32
+# Samples used to seed the baseline before events start
+SEED_SAMPLES = 16
+
+# EMA weight 1/2^EMA_SHIFT for the filtered value
+EMA_SHIFT = 1
+# Baseline tracking weight 1/2^BASE_SHIFT per sample (~5 s time constant at 20 ms)
+BASE_SHIFT = 8
+PRESS_PCT = 20
+RELEASE_PCT = 12
+DEBOUNCE = 2
+
+PRESS = 1
+RELEASE = 2
+
+QUEUE_SIZE = 16
+
+
+class EventQueue:
+    """Small bounded FIFO for asyncio (uasyncio has no Queue); drops the oldest when full."""
+    def __init__(self, size=QUEUE_SIZE):
+        self.size = size
+        self.items = []
+        self.flag = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, item):
+        if len(self.items) >= self.size:
+            self.items.pop(0)
+            self.dropped += 1
+        self.items.append(item)
+        self.flag.set()
+
+    async def get(self):
+        while not self.items:
+            self.flag.clear()
+            await self.flag.wait()
+        return self.items.pop(0)
+
+    def get_nowait(self):
+        """The oldest item, or None when empty."""
+        return self.items.pop(0) if self.items else None
+
+
+class TouchEngine:
+    def __init__(self, pad, period_ms=PERIOD_MS, timer_id=0):
+        self.pad = pad
+        self.period_ms = period_ms
+        self.timer_id = timer_id
+        self.timer = None
+        # Written by the timer callback, drained by run()
+        self.ring = array('H', [0] * RING_SIZE)
+        self.stamps = array('L', [0] * RING_SIZE)
+        self.head = 0
+        self.tail = 0
+        self.overruns = 0
+        # Tick stamp of the last sample processed; events up to it are all queued
+        self.stamp = 0
+        self.events = EventQueue()
+        self.reset()
+
+    def reset(self):
+        self.last3 = [0, 0, 0]
+        self.i3 = 0
+        # Samples seen, saturating at SEED_SAMPLES
+        self.n = 0
+        self.value = 0
+        # Fixed point, << BASE_SHIFT
+        self.base = 0
+        self.touched = False
+        self.streak = 0
+
+    # -----------------
+    # Sampling
+    # -----------------
+    def start(self):
+        from machine import Timer
+        self.timer = Timer(self.timer_id)
+        self.timer.init(period=self.period_ms, mode=Timer.PERIODIC, callback=self._sample)
+
+    def stop(self):
+        if self.timer:
+            self.timer.deinit()
+            self.timer = None
+
+    def _sample(self, _t):
+        # Timer callback: no allocation, just one read into the ring
+        try:
+            v = self.pad.read()
+        except ValueError:
+            return
+        nxt = (self.head + 1) % RING_SIZE
+        if nxt == self.tail:
+            self.overruns += 1
+            return
+        self.ring[self.head] = v
+        self.stamps[self.head] = time.ticks_ms()
+        self.head = nxt
+
+    def drain(self):
+        """Processes every sample in the ring now. Also called by consumers that
+        need to be sure no event older than some time is still waiting in it."""
+        while self.tail != self.head:
+            self.stamp = self.stamps[self.tail]
+            self.feed(self.ring[self.tail], self.stamp)
+            self.tail = (self.tail + 1) % RING_SIZE
+
+    async def run(self):
+        while True:
+            self.drain()
+            await asyncio.sleep_ms(self.period_ms * 4)
+
+    # -----------------
+    # Filtering and detection
+    # -----------------
+    def baseline(self):
+        return self.base >> BASE_SHIFT
+
+    def feed(self, raw, now=None):
+        """Processes one raw sample. Returns the event emitted (PRESS/RELEASE) or None."""
+        l3 = self.last3
+        l3[self.i3] = raw
+        self.i3 = (self.i3 + 1) % 3
+        if self.n < SEED_SAMPLES:
+            self.n += 1
+        if self.n < 3:
+            return None
+        a, b, c = l3
+        med = max(min(a, b), min(max(a, b), c))
+
+        if self.n == 3:
+            self.value = med
+            self.base = med << BASE_SHIFT
+            return None
+        self.value += (med - self.value) >> EMA_SHIFT
+
+        base = self.baseline()
+        if self.n < SEED_SAMPLES:
+            # Settle the baseline quickly on the first samples
+            self.base += ((self.value << BASE_SHIFT) - self.base) >> 2
+            return None
+
+        if not self.touched:
+            if self.value < base - base * PRESS_PCT // 100:
+                self.streak += 1
+            else:
+                self.streak = 0
+                # Only track drift while untouched, so a long press isn't absorbed
+                self.base += (self.value - base)
+        else:
+            if self.value > base - base * RELEASE_PCT // 100:
+                self.streak += 1
+            else:
+                self.streak = 0
+
+        if self.streak >= DEBOUNCE:
+            self.streak = 0
+            self.touched = not self.touched
+            kind = PRESS if self.touched else RELEASE
+            self.events.put((kind, self.value, time.ticks_ms() if now is None else now))
+            return kind
+        return None